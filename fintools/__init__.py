@@ -1,7 +1,9 @@
 from .allocation_scheme import *
 from .asset_model import *
 from .backtesting import *
+from .bootstrap import *
 from .calculator import *
+from .covariance import *
 from .cppi import *
 from .factor_data import *
 from .factors import *
@@ -10,7 +12,9 @@ from .industry_data import *
 from .metrics import *
 from .price_data import *
 from .portfolio import *
+from .random_sampling import *
 from .rate_data import *
+from .short_rate import *
 from .simulator import *
 from .statistics import *
 from .style import *
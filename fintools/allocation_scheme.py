@@ -1,6 +1,103 @@
+import copy
+
 import numpy as np
 import pandas as pd
 
+from fintools.covariance import WindowMoments
+from fintools.portfolio import global_minimum_variance_portfolio, maximize_sharpe_ratio
+
+
+class RollingWindow:
+    """
+    A window of fixed length that slides over a returns matrix one period at a time.
+    The moments of the returns in the window are maintained incrementally by WindowMoments,
+    so the mean and covariance of each window cost O(N^2) instead of O(W*N^2).
+    The moments are only tracked once they have been requested.
+    """
+
+    def __init__(self, returns: pd.DataFrame, window, start=0):
+        self.__frame = returns
+        self.__values = returns.to_numpy(dtype=float)
+        self.window = window
+        self.start = start
+        self.__moments = None
+        self.__estimators = {}
+
+    @property
+    def end(self):
+        return self.start + self.window
+
+    @property
+    def returns(self):
+        """
+        The returns in the window as a Data Frame
+        """
+        return self.__frame.iloc[self.start:self.end]
+
+    @property
+    def values(self):
+        """
+        The returns in the window as an array
+        """
+        return self.__values[self.start:self.end]
+
+    @property
+    def columns(self):
+        return self.__frame.columns
+
+    def has_next(self):
+        return self.end < len(self.__values)
+
+    def advance(self):
+        """
+        Slide the window forward by one period
+        """
+        if self.__moments is not None:
+            self.__moments.slide(self.__values[self.end])
+        self.start += 1
+
+    def __window_moments(self):
+        if self.__moments is None:
+            self.__moments = WindowMoments(self.values)
+        return self.__moments
+
+    def mean(self):
+        """
+        :return: the mean return of each asset in the window
+        """
+        return pd.Series(self.__window_moments().mean(), index=self.columns)
+
+    def covariance(self, ddof=1):
+        """
+        :return: the sample covariance matrix of the returns in the window
+        """
+        covariance = self.__window_moments().covariance(ddof)
+        return pd.DataFrame(covariance, index=self.columns, columns=self.columns)
+
+    def estimate_covariance(self, estimator):
+        """
+        Estimate the covariance of the returns in the window with a covariance estimator.
+        The window keeps its own copy of the estimator, which is updated with the entering return
+        when the window has advanced by one period since the previous estimate.
+        :param estimator: a CovarianceEstimator
+        :return: the estimated covariance matrix
+        """
+        # keyed on the estimator itself, since its id could be reused once it is garbage collected
+        tracked = self.__estimators.get(estimator)
+        if tracked is not None and tracked[1] == self.start:
+            return tracked[2]
+        covariance = None
+        if tracked is not None and tracked[1] == self.start - 1:
+            try:
+                covariance = tracked[0].update(self.__values[self.end - 1])
+            except NotImplementedError:
+                pass
+        if covariance is None:
+            tracked = (copy.deepcopy(estimator),)
+            covariance = tracked[0].estimate_covariance(self.returns)
+        self.__estimators[estimator] = (tracked[0], self.start, covariance)
+        return covariance
+
 
 class AllocationScheme:
 
@@ -10,6 +107,14 @@ class AllocationScheme:
         """
         pass
 
+    def get_window_allocation(self, window: RollingWindow):
+        """
+        Provide an allocation for the returns of a rolling window.
+        Schemes that need window moments should override this to use the incremental
+        window statistics. By default, the returns of the window are passed to get_allocation.
+        """
+        return self.get_allocation(window.returns)
+
 
 class EquallyWeightedAllocationScheme(AllocationScheme):
     """
@@ -50,3 +155,45 @@ class CapWeightedAllocationScheme(AllocationScheme):
     def get_allocation(self, returns):
         w = self.cap_weights.loc[returns.index[1]]
         return w / w.sum()
+
+
+class GlobalMinimumVarianceAllocationScheme(AllocationScheme):
+    """
+    Returns the weights of the GMV portfolio, using the covariance of the returns.
+    When no covariance estimator is supplied, the sample covariance is used.
+    Over rolling windows, the covariance estimate is updated incrementally.
+    """
+
+    def __init__(self, covariance_estimator=None):
+        self.covariance_estimator = covariance_estimator
+
+    def get_allocation(self, returns):
+        covariance = self.covariance_estimator.estimate_covariance(returns) \
+            if self.covariance_estimator is not None else returns.cov()
+        return pd.Series(global_minimum_variance_portfolio(covariance), index=returns.columns)
+
+    def get_window_allocation(self, window: RollingWindow):
+        covariance = window.estimate_covariance(self.covariance_estimator) \
+            if self.covariance_estimator is not None else window.covariance()
+        return pd.Series(global_minimum_variance_portfolio(covariance), index=window.columns)
+
+
+class MaximumSharpeRatioAllocationScheme(AllocationScheme):
+    """
+    Returns the weights of the maximum Sharpe ratio portfolio,
+    using the mean and sample covariance of the returns as estimates
+    """
+
+    def __init__(self, risk_free_rate=0):
+        """
+        :param risk_free_rate: the risk free rate per period
+        """
+        self.risk_free_rate = risk_free_rate
+
+    def get_allocation(self, returns):
+        weights = maximize_sharpe_ratio(returns.mean(), returns.cov(), risk_free_rate=self.risk_free_rate)
+        return pd.Series(weights, index=returns.columns)
+
+    def get_window_allocation(self, window: RollingWindow):
+        weights = maximize_sharpe_ratio(window.mean(), window.covariance(), risk_free_rate=self.risk_free_rate)
+        return pd.Series(weights, index=window.columns)
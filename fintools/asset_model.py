@@ -1,13 +1,22 @@
+from functools import lru_cache
+
 import numpy as np
 import pandas as pd
 
+from fintools.random_sampling import make_generator, spawn_generators, standard_normal
+
 
-# TODO: use random generator with seed
 def geometric_brownian_motion(mu, sigma,
                               years, scenarios,
                               initial_price=1.0,
                               steps_per_year=12,
-                              prices=True):
+                              prices=True,
+                              seed=None,
+                              antithetic=False,
+                              sobol=False,
+                              dtype=np.float64,
+                              output='frame',
+                              exact=False):
     """
      Evolution of stock price using a Geometric Brownian Motion model
      Generates an ensemble of time series of prices according to GBM
@@ -18,14 +27,261 @@ def geometric_brownian_motion(mu, sigma,
     :param scenarios: number of sample paths to simulate
     :param initial_price: initial price
     :param prices: return prices if True, returns if False
-    :return: A data frame with all the price (or return) sample paths
+    :param seed: seed or numpy.random.Generator for the shocks
+    :param antithetic: use antithetic variates if True
+    :param sobol: draw the shocks from a scrambled Sobol sequence if True
+    :param dtype: float64 or float32. float32 halves the memory of the paths
+    :param output: 'frame' for a DataFrame, 'array' for a numpy array or 'readonly' for a read-only array
+    :param exact: use the exact log-normal step exp((mu - sigma^2/2)dt + sigma*sqrt(dt)*Z) if True,
+        otherwise the arithmetic step 1 + mu*dt + sigma*sqrt(dt)*Z
+    :return: A data frame (or array) with all the price (or return) sample paths
     """
+    if output not in ('frame', 'array', 'readonly'):
+        raise ValueError(f"Unknown output type: {output}")
     dt = 1 / steps_per_year
     n_steps = int(years * steps_per_year)
-    rets_plus_1 = np.random.normal(size=(n_steps, scenarios), loc=1 + mu * dt, scale=sigma * np.sqrt(dt))
+    # all the arithmetic happens in place on the buffer of the shocks
+    paths = standard_normal(n_steps, scenarios, seed=seed, antithetic=antithetic, sobol=sobol, dtype=dtype)
+    paths *= sigma * np.sqrt(dt)
+    if exact:
+        paths += (mu - 0.5 * sigma ** 2) * dt
+        np.exp(paths, out=paths)
+    else:
+        paths += 1 + mu * dt
     # fix the first row
-    rets_plus_1[0] = 1
-    return initial_price * pd.DataFrame(rets_plus_1).cumprod() if prices else pd.DataFrame(rets_plus_1 - 1)
+    paths[0] = 1
+    if prices:
+        np.cumprod(paths, axis=0, out=paths)
+        paths *= initial_price
+    else:
+        paths -= 1
+    if output == 'frame':
+        return pd.DataFrame(paths, copy=False)
+    if output == 'readonly':
+        paths.flags.writeable = False
+    return paths
+
+
+def gbm_terminal_prices(mu, sigma, years, scenarios,
+                        initial_price=1.0,
+                        seed=None,
+                        antithetic=False,
+                        sobol=False,
+                        dtype=np.float64):
+    """
+    Sample the terminal prices of GBM paths directly from the exact log-normal distribution
+    S_T = S_0 * exp((mu - sigma^2/2)T + sigma*sqrt(T)*Z)
+    without stepping through the paths
+    :param mu: the mean drift
+    :param sigma: the price volatility
+    :param years: the horizon T in years
+    :param scenarios: number of sample paths to simulate
+    :param initial_price: initial price
+    :param seed: seed or numpy.random.Generator for the shocks
+    :param antithetic: use antithetic variates if True
+    :param sobol: draw the shocks from a scrambled Sobol sequence if True
+    :param dtype: float64 or float32
+    :return: an array of terminal prices, one per scenario
+    """
+    prices = standard_normal(1, scenarios, seed=seed, antithetic=antithetic, sobol=sobol, dtype=dtype)[0]
+    prices *= sigma * np.sqrt(years)
+    prices += (mu - 0.5 * sigma ** 2) * years
+    np.exp(prices, out=prices)
+    prices *= initial_price
+    return prices
+
+
+class PathStatistics:
+    """
+    Running statistics of an ensemble of price paths
+    """
+
+    def __init__(self, terminal, maximum, minimum, max_drawdown):
+        self.terminal = terminal
+        self.maximum = maximum
+        self.minimum = minimum
+        self.max_drawdown = max_drawdown
+
+    def __len__(self):
+        return len(self.terminal)
+
+    def as_data_frame(self):
+        return pd.DataFrame({
+            "terminal": self.terminal,
+            "maximum": self.maximum,
+            "minimum": self.minimum,
+            "max_drawdown": self.max_drawdown
+        })
+
+
+def gbm_path_statistics(mu, sigma, years, scenarios,
+                        initial_price=1.0,
+                        steps_per_year=12,
+                        seed=None,
+                        antithetic=False,
+                        block_steps=None):
+    """
+    Stream GBM paths with the exact log-normal step and keep only running statistics of each path:
+    terminal price, maximum, minimum and maximum drawdown.
+    Paths are generated a block of steps at a time, so memory is O(block_steps * scenarios)
+    instead of O(steps * scenarios).
+    :param mu: the mean drift
+    :param sigma: the price volatility
+    :param years: number of years to simulate
+    :param scenarios: number of sample paths to simulate
+    :param initial_price: initial price
+    :param steps_per_year: Number of periods per year
+    :param seed: seed or numpy.random.Generator for the shocks
+    :param antithetic: use antithetic variates if True
+    :param block_steps: steps generated at once. By default blocks hold about 4M values
+    :rtype: PathStatistics
+    :return: the statistics of each path
+    """
+    dt = 1 / steps_per_year
+    n_steps = int(years * steps_per_year)
+    if block_steps is None:
+        block_steps = max(1, 2 ** 22 // scenarios)
+    generator = make_generator(seed)
+    drift = (mu - 0.5 * sigma ** 2) * dt
+    diffusion = sigma * np.sqrt(dt)
+    # all the state is kept in log space relative to the initial price
+    log_price = np.zeros(scenarios)
+    log_peak = np.zeros(scenarios)
+    log_min = np.zeros(scenarios)
+    log_drawdown = np.zeros(scenarios)
+    for start in range(0, n_steps, block_steps):
+        block = standard_normal(min(block_steps, n_steps - start), scenarios,
+                                seed=generator, antithetic=antithetic)
+        block *= diffusion
+        block += drift
+        np.cumsum(block, axis=0, out=block)
+        block += log_price
+        log_price = block[-1].copy()
+        np.minimum(log_min, block.min(axis=0), out=log_min)
+        peaks = np.maximum.accumulate(block, axis=0)
+        np.maximum(peaks, log_peak, out=peaks)
+        np.minimum(log_drawdown, (block - peaks).min(axis=0), out=log_drawdown)
+        log_peak = peaks[-1].copy()
+    return PathStatistics(terminal=initial_price * np.exp(log_price),
+                          maximum=initial_price * np.exp(log_peak),
+                          minimum=initial_price * np.exp(log_min),
+                          max_drawdown=np.expm1(log_drawdown))
+
+
+@lru_cache(maxsize=16)
+def _cached_covariance_factor(key, n_assets):
+    covariance = np.frombuffer(key).reshape(n_assets, n_assets)
+    try:
+        factor = np.linalg.cholesky(covariance)
+    except np.linalg.LinAlgError:
+        # singular covariance (e.g. estimated from fewer periods than assets): use the eigen decomposition
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        factor = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+    factor.flags.writeable = False
+    return factor
+
+
+def _covariance_factor(covariance):
+    """
+    A matrix L such that L L' is the covariance, cached on the values of the covariance,
+    so simulating the same covariance again does not factorize it again
+    :param covariance: Data Frame, array or FactorCovariance
+    """
+    values = np.ascontiguousarray(np.asarray(covariance, dtype=float))
+    return _cached_covariance_factor(values.tobytes(), len(values))
+
+
+def iter_correlated_gbm(mu, covariance, years, scenarios,
+                        steps_per_year=12,
+                        exact=False,
+                        chunk_size=None,
+                        seed=None):
+    """
+    Generate the returns of correlated GBM paths of several assets in chunks of scenarios.
+    Each chunk has its own random stream spawned from the seed.
+    :param mu: vector of the mean drifts of the assets
+    :param covariance: annual covariance of the assets, e.g. from a CovarianceEstimator
+    :param years: number of years to simulate
+    :param scenarios: total number of sample paths
+    :param steps_per_year: Number of periods per year
+    :param exact: use the exact log-normal step if True, otherwise the arithmetic step, as in geometric_brownian_motion
+    :param chunk_size: scenarios per chunk. By default chunks hold about 4M returns
+    :param seed: seed or numpy.random.Generator
+    :return: a generator of (steps, chunk, assets) arrays of returns. As in geometric_brownian_motion,
+    the first row is the starting point and its returns are zero
+    """
+    factor = _covariance_factor(covariance)
+    n_assets = len(factor)
+    mu = np.broadcast_to(np.asarray(mu, dtype=float), n_assets)
+    dt = 1 / steps_per_year
+    n_steps = int(years * steps_per_year)
+    if chunk_size is None:
+        chunk_size = max(1, 2 ** 22 // max(n_steps * n_assets, 1))
+    diffusion = (factor * np.sqrt(dt)).T
+    drift = (mu - 0.5 * np.diag(factor @ factor.T)) * dt if exact else mu * dt
+    chunk_sizes = [min(chunk_size, scenarios - start) for start in range(0, scenarios, chunk_size)]
+    for size, generator in zip(chunk_sizes, spawn_generators(seed, len(chunk_sizes))):
+        returns = generator.standard_normal(size=(n_steps, size, n_assets)) @ diffusion
+        returns += drift
+        if exact:
+            np.expm1(returns, out=returns)
+        returns[0] = 0
+        yield returns
+
+
+def correlated_gbm(mu, covariance, years, scenarios,
+                   initial_prices=1.0,
+                   steps_per_year=12,
+                   prices=True,
+                   weights=None,
+                   rebalance=True,
+                   exact=False,
+                   chunk_size=None,
+                   seed=None):
+    """
+    Evolution of the prices of several correlated assets, each one a Geometric Brownian Motion.
+    If weights are given, every chunk of scenarios is reduced to the portfolio as soon as it is generated,
+    so the (steps, scenarios, assets) paths are never held in memory.
+    :param mu: vector of the mean drifts of the assets
+    :param covariance: annual covariance of the assets, e.g. from a CovarianceEstimator
+    :param years: number of years to simulate
+    :param scenarios: number of sample paths to simulate
+    :param initial_prices: initial price of each asset, or initial value of the portfolio
+    :param steps_per_year: Number of periods per year
+    :param prices: return prices (or portfolio values) if True, returns if False
+    :param weights: vector of portfolio weights. If None, return the paths of every asset
+    :param rebalance: if True the portfolio is rebalanced to the weights every period, otherwise it is bought and held
+    :param exact: use the exact log-normal step if True, otherwise the arithmetic step
+    :param chunk_size: scenarios generated at once. By default chunks hold about 4M returns
+    :param seed: seed or numpy.random.Generator
+    :return: a (steps, scenarios, assets) array of prices (or returns) if there are no weights,
+    otherwise a Data Frame of portfolio values (or returns) with one column per scenario
+    """
+    chunks = iter_correlated_gbm(mu, covariance, years, scenarios, steps_per_year=steps_per_year,
+                                 exact=exact, chunk_size=chunk_size, seed=seed)
+    if weights is None:
+        paths = np.empty((int(years * steps_per_year), scenarios, len(_covariance_factor(covariance))))
+        start = 0
+        for returns in chunks:
+            paths[:, start:start + returns.shape[1]] = returns
+            start += returns.shape[1]
+        if prices:
+            paths += 1
+            np.cumprod(paths, axis=0, out=paths)
+            paths *= np.asarray(initial_prices, dtype=float)
+        return paths
+    weights = np.asarray(weights, dtype=float)
+    portfolio_returns = []
+    for returns in chunks:
+        if rebalance:
+            portfolio_returns.append(returns @ weights)
+        else:
+            values = np.cumprod(1 + returns, axis=0) @ weights
+            portfolio_returns.append(np.concatenate([returns[:1] @ weights, values[1:] / values[:-1] - 1]))
+    paths = np.concatenate(portfolio_returns, axis=1)
+    if prices:
+        paths = initial_prices * np.cumprod(1 + paths, axis=0)
+    return pd.DataFrame(paths, copy=False)
 
 
 def show_gbm(n_scenarios, mu, sigma):
@@ -1,5 +1,9 @@
-from fintools.portfolio import compute_portfolio_return
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
 from fintools.allocation_scheme import *
+from fintools.metrics import collect_metrics
 
 
 def backtest_buy_and_hold(portfolio_weights, returns):
@@ -12,18 +16,30 @@ def backtest_buy_and_hold(portfolio_weights, returns):
         a_i(t): Allocation to position i at time t
         r_i(t): Return of position i at time t
         r_p(t): Total portfolio return at time t
-    :param portfolio_weights: The vector of portfolio weights
-    :param returns: Series or Data Frame of returns
-    :return: the sequence of portfolio returns
+    The value of the portfolio is the product of the cumulative growth matrix with the weights,
+    so many portfolios can be backtested at once with a single matrix product.
+    :param portfolio_weights: The vector of portfolio weights,
+        or a (assets, portfolios) matrix with one column of weights per portfolio.
+        Series or Data Frame weights are aligned with the columns of a Data Frame of returns
+    :param returns: Data Frame or array of returns
+    :return: the sequence of portfolio returns, with one column per portfolio if given a matrix of weights
     """
-    portfolio_returns = (returns + 1).cumprod()
-    portfolio_returns = portfolio_returns.apply(
-        lambda row: compute_portfolio_return(weights=portfolio_weights, returns=row),
-        axis=1)
-    portfolio_returns = portfolio_returns.pct_change()
+    if isinstance(returns, pd.DataFrame) and isinstance(portfolio_weights, (pd.Series, pd.DataFrame)):
+        portfolio_weights = portfolio_weights.reindex(returns.columns)
+    asset_returns = np.asarray(returns, dtype=float)
+    growth = np.cumprod(1 + asset_returns, axis=0)
+    weights = np.asarray(portfolio_weights, dtype=float)
+    values = growth @ weights
+    portfolio_returns = np.empty_like(values)
+    portfolio_returns[1:] = values[1:] / values[:-1] - 1
     # The first return is simply the weighted average of the initial returns
-    portfolio_returns.iloc[0] = compute_portfolio_return(weights=portfolio_weights, returns=returns.iloc[0])
-    return portfolio_returns
+    portfolio_returns[0] = asset_returns[0] @ weights
+    if not isinstance(returns, pd.DataFrame):
+        return portfolio_returns
+    if portfolio_returns.ndim == 1:
+        return pd.Series(portfolio_returns, index=returns.index)
+    columns = portfolio_weights.columns if isinstance(portfolio_weights, pd.DataFrame) else None
+    return pd.DataFrame(portfolio_returns, index=returns.index, columns=columns)
 
 
 def backtest_daily_rebalance(portfolio_weights, returns):
@@ -41,20 +57,131 @@ def final_wealth(portfolio_returns, initial_investment=1.0):
 
 
 def backtest_allocation(returns, estimation_window=60,
-                        allocation_scheme: AllocationScheme = EquallyWeightedAllocationScheme()):
+                        allocation_scheme: AllocationScheme = EquallyWeightedAllocationScheme(),
+                        executor='serial',
+                        n_workers=None):
     """
     Backtests a given allocation scheme, given some parameters:
     returns : asset returns to use to build the portfolio
     estimation_window: the window to use to estimate parameters
     weighting: the weighting scheme to use, must be a function that takes "r", and a variable number of keyword-value arguments
+    executor: 'serial', 'threads' or 'processes'. The windows are split into contiguous blocks that are
+        allocated in parallel. With processes, the returns are placed in shared memory instead of being
+        pickled for every task, and the scheme must be picklable
+    n_workers: number of threads or processes. None uses the number of cores
     """
-    n_periods = returns.shape[0]
-    # return windows
-    windows = [(start, start + estimation_window) for start in range(n_periods - estimation_window)]
-    weights = [allocation_scheme.get_allocation(returns.iloc[win[0]:win[1]]) for win in windows]
-    # convert List of weights to DataFrame
-    weights = pd.DataFrame(weights, index=returns.iloc[estimation_window:].index, columns=returns.columns)
+    weights = _allocate(returns, estimation_window, [allocation_scheme], executor, n_workers)[0]
     returns = (weights * returns).sum(axis="columns", min_count=1)
     return returns
 
 
+def backtest_many(returns, schemes, estimation_window=60, risk_free_rate=0.0,
+                  executor='serial', n_workers=None):
+    """
+    Backtest several allocation schemes over the same windows.
+    Every window is sliced once and shared by all the schemes.
+    :param returns: asset returns to use to build the portfolios
+    :param schemes: a dictionary of allocation schemes by name, or a list of schemes named after their class
+    :param estimation_window: the window to use to estimate parameters
+    :param risk_free_rate: the risk free rate used for the metrics
+    :param executor: 'serial', 'threads' or 'processes', as in backtest_allocation
+    :param n_workers: number of threads or processes. None uses the number of cores
+    :return: a Data Frame of portfolio returns with one column per scheme, covering the periods after
+        the first estimation window, and a Data Frame with the metrics of each scheme
+    """
+    if not isinstance(schemes, dict):
+        schemes = {type(scheme).__name__: scheme for scheme in schemes}
+    weights = _allocate(returns, estimation_window, list(schemes.values()), executor, n_workers)
+    asset_returns = returns.iloc[estimation_window:]
+    portfolio_returns = pd.DataFrame({name: (scheme_weights * asset_returns).sum(axis="columns", min_count=1)
+                                      for name, scheme_weights in zip(schemes, weights)})
+    return portfolio_returns, collect_metrics(portfolio_returns, risk_free_rate=risk_free_rate)
+
+
+def _allocate(returns, estimation_window, schemes, executor, n_workers):
+    """
+    Allocate every window with each scheme
+    :return: a list with a Data Frame of weights for each scheme, indexed by the period following each window
+    """
+    n_periods = returns.shape[0]
+    n_windows = max(n_periods - estimation_window, 0)
+    if executor == 'serial':
+        weights = _allocate_windows(returns, estimation_window, schemes, 0, n_windows)
+    elif executor in ('threads', 'processes'):
+        weights = _allocate_windows_in_parallel(returns, estimation_window, schemes,
+                                                n_windows, executor, n_workers)
+    else:
+        raise ValueError(f"Unknown executor: {executor}")
+    # convert List of weights to DataFrame
+    index = returns.iloc[estimation_window:].index
+    return [pd.DataFrame(scheme_weights, index=index, columns=returns.columns) for scheme_weights in weights]
+
+
+def _allocate_windows(returns, estimation_window, schemes, start, stop):
+    """
+    Allocate the windows that start at positions start, ..., stop - 1, sliding one window over them
+    :return: the list of weights of each scheme
+    """
+    window = RollingWindow(returns, estimation_window, start=start)
+    weights = [[] for _ in schemes]
+    for step in range(start, stop):
+        if step > start:
+            window.advance()
+        for scheme, scheme_weights in zip(schemes, weights):
+            scheme_weights.append(scheme.get_window_allocation(window))
+    return weights
+
+
+def _merge_blocks(results, n_schemes):
+    """
+    Concatenate the weights of consecutive blocks, for each scheme
+    """
+    weights = [[] for _ in range(n_schemes)]
+    for block_weights in results:
+        for scheme_weights, weights_in_block in zip(weights, block_weights):
+            scheme_weights.extend(weights_in_block)
+    return weights
+
+
+def _allocate_windows_in_parallel(returns, estimation_window, schemes, n_windows, executor, n_workers):
+    n_workers = n_workers or os.cpu_count()
+    # a few blocks per worker balance the load; windows within a block share incremental moments
+    blocks = [(block[0], block[-1] + 1) for block in np.array_split(np.arange(n_windows), 4 * n_workers)
+              if len(block) > 0]
+    if executor == 'threads':
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            results = pool.map(lambda block: _allocate_windows(returns, estimation_window, schemes, *block), blocks)
+            return _merge_blocks(results, len(schemes))
+
+    values = returns.to_numpy(dtype=float)
+    shared = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    try:
+        np.ndarray(values.shape, dtype=values.dtype, buffer=shared.buf)[:] = values
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 initializer=_attach_shared_returns,
+                                 initargs=(shared.name, values.shape, returns.index, returns.columns)) as pool:
+            tasks = [(estimation_window, schemes, block) for block in blocks]
+            results = pool.map(_allocate_shared_windows, tasks)
+            return _merge_blocks(results, len(schemes))
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+# the returns of a parallel backtest, attached once in every worker process
+_shared_returns = {}
+
+
+def _attach_shared_returns(name, shape, index, columns):
+    shared = shared_memory.SharedMemory(name=name)
+    values = np.ndarray(shape, dtype=float, buffer=shared.buf)
+    _shared_returns['memory'] = shared
+    _shared_returns['returns'] = pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+
+def _allocate_shared_windows(task):
+    """
+    Allocate a block of windows over the returns in shared memory
+    """
+    estimation_window, schemes, (start, stop) = task
+    return _allocate_windows(_shared_returns['returns'], estimation_window, schemes, start, stop)
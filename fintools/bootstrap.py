@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+from fintools.random_sampling import make_generator
+
+
+def bootstrap_indices(n_periods, n_steps, n_scenarios,
+                      method='stationary',
+                      block_size=12,
+                      seed=None):
+    """
+    Draw the rows of the history that make up each bootstrap path
+    'iid': every step samples a period independently
+    'circular': consecutive blocks of block_size periods, starting at random and wrapping around the end
+    'stationary': blocks of random (geometric) length with mean block_size, as in Politis and Romano (1994)
+    :param n_periods: number of periods of the history
+    :param n_steps: number of steps of each path
+    :param n_scenarios: number of paths
+    :param method: 'iid', 'circular' or 'stationary'
+    :param block_size: (mean) number of consecutive periods sampled together
+    :param seed: seed or numpy.random.Generator
+    :return: a (n_steps, n_scenarios) integer array of row positions in the history
+    """
+    generator = make_generator(seed)
+    dtype = np.int32 if n_periods < 2 ** 31 else np.int64
+    if method == 'iid':
+        return generator.integers(0, n_periods, size=(n_steps, n_scenarios), dtype=dtype)
+    if method == 'circular':
+        n_blocks = -(-n_steps // block_size)
+        starts = generator.integers(0, n_periods, size=(n_blocks, 1, n_scenarios), dtype=dtype)
+        offsets = np.arange(block_size, dtype=dtype).reshape(1, -1, 1)
+        indices = (starts + offsets).reshape(-1, n_scenarios)[:n_steps]
+        return np.remainder(indices, n_periods, out=indices)
+    if method == 'stationary':
+        starts = generator.integers(0, n_periods, size=(n_steps, n_scenarios), dtype=dtype)
+        is_new_block = generator.random(size=(n_steps, n_scenarios)) < 1 / block_size
+        is_new_block[0] = True
+        # each step continues the block started at the last new block
+        steps = np.arange(n_steps, dtype=dtype).reshape(-1, 1)
+        block_start = np.where(is_new_block, steps, 0)
+        np.maximum.accumulate(block_start, axis=0, out=block_start)
+        indices = np.take_along_axis(starts, block_start, axis=0)
+        indices += steps
+        indices -= block_start
+        return np.remainder(indices, n_periods, out=indices)
+    raise ValueError(f"Unknown bootstrap method: {method}")
+
+
+class BootstrapScenarios:
+    """
+    Scenarios of returns resampled from a history of returns.
+    Whole rows of the history are sampled, so every path keeps the cross-sectional correlation of the assets.
+    Only the row positions are stored: the returns are gathered from the history when they are requested.
+    """
+
+    def __init__(self, values, indices, columns=None):
+        """
+        :param values: (periods, assets) array of historical returns
+        :param indices: (steps, scenarios) integer array of rows of the history
+        :param columns: the names of the assets
+        """
+        self.values = values
+        self.indices = indices
+        self.columns = pd.RangeIndex(values.shape[1]) if columns is None else pd.Index(columns)
+
+    def __len__(self):
+        return self.indices.shape[1]
+
+    @property
+    def n_steps(self):
+        return self.indices.shape[0]
+
+    def panel(self):
+        """
+        :return: a (steps, scenarios, assets) array of returns,
+        e.g. for backtest_buy_and_hold(weights, scenarios.panel()) or StrategySimulator.simulate
+        """
+        return self.values[self.indices]
+
+    def asset(self, column=None):
+        """
+        The paths of the returns of a single asset, e.g. the risky returns for backtest_cppi
+        :param column: the name of the asset. May be omitted if there is only one asset
+        :return: a (steps, scenarios) Data Frame
+        """
+        position = 0 if column is None and len(self.columns) == 1 else self.columns.get_loc(column)
+        return pd.DataFrame(self.values[:, position][self.indices], copy=False)
+
+    def scenario(self, scenario):
+        """
+        The returns of all the assets along one path, e.g. for StrategySimulator.simulate
+        :param scenario: the position of the path
+        :return: a (steps, assets) Data Frame
+        """
+        return pd.DataFrame(self.values[self.indices[:, scenario]], columns=self.columns)
+
+    def __iter__(self):
+        for scenario in range(len(self)):
+            yield self.scenario(scenario)
+
+
+def bootstrap_returns(returns,
+                      n_steps=None,
+                      n_scenarios=1000,
+                      method='stationary',
+                      block_size=12,
+                      seed=None):
+    """
+    Monte Carlo scenarios of returns bootstrapped from historical returns,
+    e.g. from load_industry_returns or load_fff_returns_monthly
+    :param returns: Series, Data Frame or array of historical returns, one column per asset
+    :param n_steps: number of steps of each path. Default is the length of the history
+    :param n_scenarios: number of paths
+    :param method: 'iid', 'circular' or 'stationary', as in bootstrap_indices
+    :param block_size: (mean) number of consecutive periods sampled together
+    :param seed: seed or numpy.random.Generator
+    :rtype: BootstrapScenarios
+    :return: the resampled scenarios
+    """
+    if isinstance(returns, pd.Series):
+        returns = returns.to_frame()
+    columns = returns.columns if isinstance(returns, pd.DataFrame) else None
+    values = np.asarray(returns, dtype=float)
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+    if n_steps is None:
+        n_steps = len(values)
+    indices = bootstrap_indices(len(values), n_steps, n_scenarios,
+                                method=method, block_size=block_size, seed=seed)
+    return BootstrapScenarios(values, indices, columns)
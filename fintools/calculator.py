@@ -32,6 +32,9 @@ def compute_compound_return(returns):
     :return: the compounded return
     """
     # This implementation uses sum instead of product and is faster than: (returns + 1).prod() - 1
+    # A loss beyond -100% (e.g. a leveraged position) has no logarithm, so the product is used instead
+    if np.any(np.asarray(returns) <= -1):
+        return (returns + 1).prod() - 1
     return np.expm1(np.log1p(returns).sum())
 
 
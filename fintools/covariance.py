@@ -4,11 +4,130 @@ import pandas as pd
 
 class CovarianceEstimator:
     """
-    Interface for covariance estimators
+    Interface for covariance estimators.
+    estimate_covariance also sets the estimation window of the estimator,
+    which update then slides forward one period at a time.
     """
     def estimate_covariance(self, returns):
         pass
 
+    def update(self, new_row):
+        """
+        Slide the estimation window forward by one period: the oldest return leaves the window
+        and new_row enters it. estimate_covariance must have been called first.
+        :param new_row: the returns of each asset in the new period
+        :return: the covariance estimate of the new window
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support incremental updates")
+
+    def _slide_window(self, new_row):
+        """
+        Slide the moments of the estimation window. Estimators that do not need the moments for
+        estimate_covariance set _moments to None and keep the returns of the window in _window,
+        so the moments are only computed the first time the window slides.
+        :return: the moments of the new window
+        """
+        if self._moments is None:
+            self._moments = WindowMoments(self._window)
+            self._window = None
+        self._moments.slide(new_row)
+        return self._moments
+
+
+class WindowMoments:
+    """
+    Moments of a sliding window of returns, updated in O(N^2) when a row enters the window and the oldest leaves.
+    The rows are shifted by the mean of the window when the moments were last computed from scratch,
+    which happens once per window length to stop rounding errors from accumulating.
+    With higher_moments, the cross moments of order 4 needed by the shrinkage intensities are tracked too.
+    """
+
+    def __init__(self, returns, higher_moments=False):
+        """
+        :param returns: Data Frame or array of the returns in the initial window
+        :param higher_moments: if True, also track the moments used by fourth_moments
+        """
+        values = np.asarray(returns, dtype=float)
+        self.columns = returns.columns if isinstance(returns, pd.DataFrame) else None
+        self.higher_moments = higher_moments
+        self.rows = values.copy()
+        self.oldest = 0
+        self.__reset()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __reset(self):
+        self.shift = self.rows.mean(axis=0)
+        x = self.rows - self.shift
+        self.updates = 0
+        self.sum = x.sum(axis=0)
+        self.cross = x.T @ x
+        if self.higher_moments:
+            x2 = x ** 2
+            self.sum2 = x2.sum(axis=0)
+            self.sum3 = (x2 * x).sum(axis=0)
+            self.cross21 = x2.T @ x
+            self.cross31 = (x2 * x).T @ x
+            self.cross22 = x2.T @ x2
+
+    def __accumulate(self, x, sign):
+        self.sum += sign * x
+        self.cross += sign * np.outer(x, x)
+        if self.higher_moments:
+            x2 = x ** 2
+            self.sum2 += sign * x2
+            self.sum3 += sign * x2 * x
+            self.cross21 += sign * np.outer(x2, x)
+            self.cross31 += sign * np.outer(x2 * x, x)
+            self.cross22 += sign * np.outer(x2, x2)
+
+    def slide(self, new_row):
+        """
+        Slide the window forward by one period: new_row enters and the oldest row leaves
+        :param new_row: the returns of each asset in the new period
+        """
+        new_row = np.asarray(new_row, dtype=float)
+        self.__accumulate(new_row - self.shift, 1)
+        self.__accumulate(self.rows[self.oldest] - self.shift, -1)
+        self.rows[self.oldest] = new_row
+        self.oldest = (self.oldest + 1) % len(self.rows)
+        self.updates += 1
+        if self.updates >= len(self.rows):
+            self.__reset()
+
+    def mean(self):
+        """
+        :return: the mean return of each asset in the window
+        """
+        return self.shift + self.sum / len(self.rows)
+
+    def covariance(self, ddof=1):
+        """
+        :return: the covariance matrix of the returns in the window, as an array
+        """
+        n = len(self.rows)
+        return (self.cross - np.outer(self.sum, self.sum) / n) / (n - ddof)
+
+    def fourth_moments(self):
+        """
+        :return: the central moments mean((x_i - m_i)^2 * (x_j - m_j)^2) and mean((x_i - m_i)^3 * (x_j - m_j))
+        """
+        n = len(self.rows)
+        m = (self.sum / n).reshape(-1, 1)
+        mt = m.T
+        s1, s2, s3 = self.sum.reshape(-1, 1), self.sum2.reshape(-1, 1), self.sum3.reshape(-1, 1)
+        m22 = (self.cross22 - 2 * mt * self.cross21 - 2 * m * self.cross21.T + 4 * m * mt * self.cross
+               + mt ** 2 * s2 + m ** 2 * s2.T - 2 * m * mt ** 2 * s1 - 2 * m ** 2 * mt * s1.T + n * m ** 2 * mt ** 2)
+        m31 = (self.cross31 - mt * s3 - 3 * m * self.cross21 + 3 * m * mt * s2 + 3 * m ** 2 * self.cross
+               - 3 * m ** 2 * mt * s1 - m ** 3 * s1.T + n * m ** 3 * mt)
+        return m22 / n, m31 / n
+
+    def as_data_frame(self, covariance):
+        if self.columns is None:
+            return covariance
+        return pd.DataFrame(covariance, index=self.columns, columns=self.columns)
+
 
 class SampleCovarianceEstimator(CovarianceEstimator):
 
@@ -16,8 +135,27 @@ class SampleCovarianceEstimator(CovarianceEstimator):
         """
         Returns the sample covariance of the supplied returns
         """
+        self._window, self._moments = returns, None
         return returns.cov()
 
+    def update(self, new_row):
+        moments = self._slide_window(new_row)
+        return moments.as_data_frame(moments.covariance())
+
+
+def _constant_correlation(covariance):
+    """
+    The Elton/Gruber constant correlation matrix with the variances of the covariance matrix
+    """
+    sd = np.sqrt(np.diag(covariance))
+    rhos = covariance / np.outer(sd, sd)
+    n = rhos.shape[0]
+    # this is a symmetric matrix with diagonals all 1 - so the mean correlation is ...
+    rho_bar = (rhos.sum() - n) / (n * (n - 1))
+    ccor = np.full_like(rhos, rho_bar)
+    np.fill_diagonal(ccor, 1.)
+    return ccor * np.outer(sd, sd), rho_bar
+
 
 class ConstantCorrelationCovarianceEstimator(CovarianceEstimator):
 
@@ -25,11 +163,315 @@ class ConstantCorrelationCovarianceEstimator(CovarianceEstimator):
         """
         Estimates a covariance matrix by using the Elton/Gruber Constant Correlation model
         """
-        rhos = returns.corr()
-        n = rhos.shape[0]
-        # this is a symmetric matrix with diagonals all 1 - so the mean correlation is ...
-        rho_bar = (rhos.values.sum() - n) / (n * (n - 1))
-        ccor = np.full_like(rhos, rho_bar)
-        np.fill_diagonal(ccor, 1.)
-        sd = returns.std()
-        return pd.DataFrame(ccor * np.outer(sd, sd), index=returns.columns, columns=returns.columns)
+        self._window, self._moments = returns, None
+        covariance, _ = _constant_correlation(returns.cov().to_numpy())
+        return pd.DataFrame(covariance, index=returns.columns, columns=returns.columns)
+
+    def update(self, new_row):
+        moments = self._slide_window(new_row)
+        covariance, _ = _constant_correlation(moments.covariance())
+        return moments.as_data_frame(covariance)
+
+
+class LedoitWolfCovarianceEstimator(CovarianceEstimator):
+    """
+    Ledoit-Wolf shrinkage of the (maximum likelihood) sample covariance towards a structured target,
+    with the optimal shrinkage intensity estimated from the returns:
+    - 'identity': the average variance times the identity matrix (Ledoit and Wolf, 2004, as in scikit-learn)
+    - 'constant_correlation': the constant correlation model ("Honey, I shrunk the sample covariance matrix")
+    """
+
+    def __init__(self, target='constant_correlation'):
+        if target not in ('identity', 'constant_correlation'):
+            raise ValueError(f"Unknown shrinkage target: {target}")
+        self.target = target
+        self.shrinkage = None
+
+    def estimate_covariance(self, returns):
+        self._moments = WindowMoments(returns, higher_moments=True)
+        return self._moments.as_data_frame(self._shrink())
+
+    def update(self, new_row):
+        self._moments.slide(new_row)
+        return self._moments.as_data_frame(self._shrink())
+
+    def _shrink(self):
+        n = len(self._moments)
+        sample = self._moments.covariance(ddof=0)
+        m22, m31 = self._moments.fourth_moments()
+        # sum of the asymptotic variances of the entries of the sample covariance
+        phi = (m22 - sample ** 2).sum()
+        if self.target == 'identity':
+            p = sample.shape[0]
+            mu = np.trace(sample) / p
+            target = mu * np.eye(p)
+            delta = ((sample - target) ** 2).sum() / p
+            beta = min(phi / (p * n), delta)
+            self.shrinkage = 0. if beta == 0 else beta / delta
+        else:
+            target, rho_bar = _constant_correlation(sample)
+            variances = np.diag(sample)
+            sd = np.sqrt(variances)
+            theta = m31 - variances.reshape(-1, 1) * sample
+            np.fill_diagonal(theta, 0)
+            rho = np.trace(m22 - sample ** 2) + rho_bar * (np.outer(1 / sd, sd) * theta).sum()
+            gamma = ((sample - target) ** 2).sum()
+            self.shrinkage = max(0., min(1., (phi - rho) / gamma / n)) if gamma > 0 else 0.
+        return self.shrinkage * target + (1 - self.shrinkage) * sample
+
+
+class OracleApproximatingShrinkageCovarianceEstimator(CovarianceEstimator):
+    """
+    Oracle Approximating Shrinkage (Chen, Wiesel, Eldar and Hero, 2010) of the (maximum likelihood)
+    sample covariance towards the average variance times the identity, as in scikit-learn
+    """
+
+    def __init__(self):
+        self.shrinkage = None
+
+    def estimate_covariance(self, returns):
+        self._moments = WindowMoments(returns)
+        return self._moments.as_data_frame(self._shrink())
+
+    def update(self, new_row):
+        self._moments.slide(new_row)
+        return self._moments.as_data_frame(self._shrink())
+
+    def _shrink(self):
+        n = len(self._moments)
+        sample = self._moments.covariance(ddof=0)
+        p = sample.shape[0]
+        alpha = np.mean(sample ** 2)
+        mu = np.trace(sample) / p
+        numerator = alpha + mu ** 2
+        denominator = (n + 1) * (alpha - mu ** 2 / p)
+        self.shrinkage = 1. if denominator == 0 else min(numerator / denominator, 1.)
+        return (1 - self.shrinkage) * sample + self.shrinkage * mu * np.eye(p)
+
+
+class EwmaCovarianceEstimator(CovarianceEstimator):
+    """
+    Exponentially weighted (RiskMetrics) covariance of zero mean returns over the estimation window:
+    the weight of the return k periods ago is proportional to decay^k.
+    On update the weights of the window decay, the new return enters with weight 1
+    and the oldest return, whose weight has decayed to decay^W, leaves the window.
+    """
+
+    def __init__(self, decay=0.94):
+        """
+        :param decay: the decay factor lambda of the weights
+        """
+        self.decay = decay
+
+    def estimate_covariance(self, returns):
+        values = np.asarray(returns, dtype=float)
+        self._columns = returns.columns if isinstance(returns, pd.DataFrame) else None
+        self._rows = values.copy()
+        self._oldest = 0
+        self.__reset()
+        return self._covariance()
+
+    def update(self, new_row):
+        new_row = np.asarray(new_row, dtype=float)
+        leaving = self._rows[self._oldest]
+        self._weighted_cross = self.decay * self._weighted_cross + np.outer(new_row, new_row) \
+            - self.decay ** len(self._rows) * np.outer(leaving, leaving)
+        self._rows[self._oldest] = new_row
+        self._oldest = (self._oldest + 1) % len(self._rows)
+        self._updates += 1
+        # recompute from scratch once per window length, to stop rounding errors from accumulating
+        if self._updates >= len(self._rows):
+            self.__reset()
+        return self._covariance()
+
+    def __reset(self):
+        values = np.roll(self._rows, -self._oldest, axis=0)
+        weights = self.decay ** np.arange(len(values) - 1, -1, -1)
+        self._weighted_cross = (values * weights.reshape(-1, 1)).T @ values
+        self._total_weight = weights.sum()
+        self._updates = 0
+
+    def _covariance(self):
+        covariance = self._weighted_cross / self._total_weight
+        if self._columns is None:
+            return covariance
+        return pd.DataFrame(covariance, index=self._columns, columns=self._columns)
+
+
+class StatisticalFactorCovarianceEstimator(CovarianceEstimator):
+    """
+    Statistical factor model: the first principal components of the sample covariance explain
+    the common variance, and each asset keeps its own residual variance.
+    On update the principal components are tracked by subspace iteration, started from the previous ones
+    and a few extra directions, which costs O(N^2 * n_factors) per step instead of a full eigen decomposition.
+    The iteration stops when the residuals of the components are within tolerance, so the estimates match
+    those of estimate_covariance on the same window. If the iteration does not converge (e.g. when the eigenvalues
+    around the last component are close) or once per window length, the components are recomputed exactly.
+    """
+
+    def __init__(self, n_factors=3, oversampling=5, tolerance=1e-10, max_iterations=20):
+        """
+        :param n_factors: number of principal components
+        :param oversampling: number of extra directions tracked by update
+        :param tolerance: largest residual norm |S*v - lambda*v| of the tracked components,
+            relative to the largest eigenvalue
+        :param max_iterations: number of subspace iterations before falling back to an eigen decomposition
+        """
+        self.n_factors = n_factors
+        self.oversampling = oversampling
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+
+    def estimate_covariance(self, returns):
+        self._moments = WindowMoments(returns)
+        sample = self._moments.covariance()
+        self.__decompose(sample)
+        return self._moments.as_data_frame(self._factor_covariance(sample))
+
+    def update(self, new_row):
+        self._moments.slide(new_row)
+        sample = self._moments.covariance()
+        if self._moments.updates == 0 or not self.__track(sample):
+            self.__decompose(sample)
+        return self._moments.as_data_frame(self._factor_covariance(sample))
+
+    def __decompose(self, sample):
+        eigenvalues, eigenvectors = np.linalg.eigh(sample)
+        self._basis = eigenvectors[:, ::-1][:, :self.n_factors + self.oversampling]
+
+    def __track(self, sample):
+        """
+        Subspace iteration from the previous basis
+        :return: True if the leading components have converged
+        """
+        for _ in range(self.max_iterations):
+            self._basis, _ = np.linalg.qr(sample @ self._basis)
+            eigenvalues, rotation = np.linalg.eigh(self._basis.T @ sample @ self._basis)
+            self._basis = self._basis @ rotation[:, ::-1]
+            eigenvalues = eigenvalues[::-1][:self.n_factors]
+            components = self._basis[:, :self.n_factors]
+            residuals = np.linalg.norm(sample @ components - components * eigenvalues, axis=0)
+            if residuals.max() <= self.tolerance * abs(eigenvalues[0]):
+                return True
+        return False
+
+    def _factor_covariance(self, sample):
+        # rotate the basis to the eigenvectors of the sample covariance restricted to its span
+        eigenvalues, rotation = np.linalg.eigh(self._basis.T @ sample @ self._basis)
+        self._basis = self._basis @ rotation[:, ::-1]
+        variances = np.maximum(eigenvalues[::-1][:self.n_factors], 0)
+        loadings = self._basis[:, :self.n_factors] * np.sqrt(variances)
+        common = loadings @ loadings.T
+        return common + np.diag(np.diag(sample) - np.diag(common))
+
+
+class FactorCovariance:
+    """
+    A covariance matrix with the structure of a factor model, B*F*B' + diag(D), where
+    B are the (N, K) factor loadings, F the (K, K) factor covariance and D the specific variances.
+    Products, portfolio variances and solves cost O(N*K) instead of O(N^2) or O(N^3),
+    and the dense matrix is only built when it is converted to an array or a Data Frame.
+    """
+
+    def __init__(self, loadings, factor_covariance, specific_variances, assets=None):
+        self.loadings = np.asarray(loadings, dtype=float)
+        self.factor_covariance = np.asarray(factor_covariance, dtype=float)
+        self.specific_variances = np.asarray(specific_variances, dtype=float)
+        self.assets = assets
+        self.__capacitance = None
+
+    @property
+    def shape(self):
+        n = len(self.specific_variances)
+        return n, n
+
+    def __len__(self):
+        return len(self.specific_variances)
+
+    def __matmul__(self, x):
+        x = np.asarray(x, dtype=float)
+        specific = self.specific_variances if x.ndim == 1 else self.specific_variances.reshape(-1, 1)
+        return self.loadings @ (self.factor_covariance @ (self.loadings.T @ x)) + specific * x
+
+    def __rmatmul__(self, x):
+        # the matrix is symmetric
+        return (self @ np.asarray(x, dtype=float).T).T
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self.loadings @ self.factor_covariance @ self.loadings.T + np.diag(self.specific_variances)
+        return dense if dtype is None else dense.astype(dtype)
+
+    def diagonal(self):
+        return np.einsum('ik,kl,il->i', self.loadings, self.factor_covariance, self.loadings) + self.specific_variances
+
+    def portfolio_variance(self, weights):
+        """
+        :param weights: the weights of the portfolio
+        :return: the variance w'*B*F*B'*w + w'*D*w of the portfolio
+        """
+        weights = np.asarray(weights, dtype=float)
+        exposures = self.loadings.T @ weights
+        return exposures @ self.factor_covariance @ exposures + self.specific_variances @ weights ** 2
+
+    def solve(self, x):
+        """
+        Solve Cov * y = x with the Woodbury identity:
+        inv(Cov) = inv(D) - inv(D)*B*inv(inv(F) + B'*inv(D)*B)*B'*inv(D)
+        :param x: a (N,) vector or a (N, M) matrix
+        :return: inv(Cov) * x
+        """
+        x = np.asarray(x, dtype=float)
+        inverse_specific = 1 / self.specific_variances
+        if x.ndim > 1:
+            inverse_specific = inverse_specific.reshape(-1, 1)
+        if self.__capacitance is None:
+            scaled = self.loadings / self.specific_variances.reshape(-1, 1)
+            self.__capacitance = np.linalg.cholesky(np.linalg.inv(self.factor_covariance) + self.loadings.T @ scaled)
+        y = inverse_specific * x
+        # solve the small (K, K) capacitance system through its Cholesky factor
+        z = np.linalg.solve(self.__capacitance.T, np.linalg.solve(self.__capacitance, self.loadings.T @ y))
+        return y - inverse_specific * (self.loadings @ z)
+
+    def subset(self, assets):
+        """
+        The covariance of a subset of the assets, which has the same factor structure
+        :param assets: a boolean mask or the positions of the assets
+        """
+        return FactorCovariance(self.loadings[assets], self.factor_covariance, self.specific_variances[assets],
+                                None if self.assets is None else self.assets[assets])
+
+    def as_data_frame(self):
+        return pd.DataFrame(np.asarray(self), index=self.assets, columns=self.assets)
+
+
+class FactorModelCovarianceEstimator(CovarianceEstimator):
+    """
+    Estimates the covariance of the returns with a factor model and returns it as a FactorCovariance.
+    With factor returns, e.g. the Fama-French factors of load_fff_returns_monthly, the loadings are
+    the slopes of the time series regression of each asset on the factors over the common periods.
+    Without factors, the first principal components of the sample covariance are used as factors.
+    """
+
+    def __init__(self, factors=None, n_factors=3):
+        """
+        :param factors: optional Data Frame of factor returns, indexed like the returns
+        :param n_factors: number of principal components, when no factors are supplied
+        """
+        self.factors = factors
+        self.n_factors = n_factors
+
+    def estimate_covariance(self, returns):
+        if self.factors is None:
+            sample = returns.cov().to_numpy()
+            eigenvalues, eigenvectors = np.linalg.eigh(sample)
+            eigenvalues = np.maximum(eigenvalues[::-1][:self.n_factors], 0)
+            loadings = eigenvectors[:, ::-1][:, :self.n_factors]
+            common = np.einsum('ik,k,ik->i', loadings, eigenvalues, loadings)
+            return FactorCovariance(loadings, np.diag(eigenvalues), np.diag(sample) - common, returns.columns)
+        factors = self.factors.reindex(returns.index).dropna()
+        assets = returns.loc[factors.index].to_numpy(dtype=float)
+        design = np.column_stack([np.ones(len(factors)), factors.to_numpy(dtype=float)])
+        coefficients, _, _, _ = np.linalg.lstsq(design, assets, rcond=None)
+        residuals = assets - design @ coefficients
+        specific_variances = (residuals ** 2).sum(axis=0) / (len(design) - design.shape[1])
+        return FactorCovariance(coefficients[1:].T, factors.cov().to_numpy(), specific_variances, returns.columns)
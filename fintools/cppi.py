@@ -1,7 +1,10 @@
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
 
 from fintools.asset_model import geometric_brownian_motion
+from fintools.random_sampling import spawn_generators
 
 #TODO
 # class CcpiStrategy(InvestmentStrategy):
@@ -46,52 +49,115 @@ def backtest_cppi(risky_returns,
 
     # Ensure returns are a data frame
     if isinstance(risky_returns, pd.Series):
-        risky_returns = pd.DataFrame(risky_returns, columns=["R"])
+        risky_returns = risky_returns.to_frame(name="R")
 
+    risky = risky_returns.to_numpy(dtype=float)
     # If no safe asset is specified, default to the risk free rate
     if safe_returns is None:
-        safe_returns = pd.DataFrame().reindex_like(risky_returns)
-        safe_returns.values[:] = risk_free_rate / 12  # fast way to set all values to a number
-
-    # set up the CPPI parameters
-    dates = risky_returns.index
-    steps = len(dates)
-    account_value = start_value
-    floor_value = start_value * cushion_ratio
-    peak = account_value
+        safe = risk_free_rate / 12
+    else:
+        safe = _as_return_matrix(safe_returns, risky.shape)
+    history = _cppi_kernel(risky, safe,
+                           multiplier=multiplier,
+                           cushion_ratio=cushion_ratio,
+                           drawdown=drawdown,
+                           start_value=start_value)
+
+    def to_frame(values):
+        return pd.DataFrame(values, index=risky_returns.index, columns=risky_returns.columns)
+
+    risky_wealth = np.add(1, risky)
+    np.cumprod(risky_wealth, axis=0, out=risky_wealth)
+    risky_wealth *= start_value
+    return {
+        "wealth": to_frame(history["wealth"]),
+        "risky_wealth": to_frame(risky_wealth),
+        "risk_budget": to_frame(history["risk_budget"]),
+        "risky_allocation": to_frame(history["risky_allocation"]),
+        "peak": to_frame(history["peak"]),
+        "floor": to_frame(history["floor"])
+    }
 
-    # set up some DataFrames for saving intermediate values
-    account_history = pd.DataFrame().reindex_like(risky_returns)
-    risky_w_history = pd.DataFrame().reindex_like(risky_returns)
-    cushion_history = pd.DataFrame().reindex_like(risky_returns)
-    floorval_history = pd.DataFrame().reindex_like(risky_returns)
-    peak_history = pd.DataFrame().reindex_like(risky_returns)
+
+def _as_return_matrix(returns, shape):
+    """
+    Broadcast a scalar, a single return sequence or a matrix of returns to a (steps, scenarios) array
+    """
+    values = np.asarray(returns, dtype=float)
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+    return np.broadcast_to(values, shape)
+
+
+def _cppi_steps(risky, safe, multiplier, cushion_ratio, drawdown, start_value):
+    """
+    Step through CPPI on a (steps, scenarios) array of risky returns, updating every scenario at once.
+    :param risky: array of risky returns with one column per scenario
+    :param safe: safe returns, either a scalar or an array that broadcasts to the shape of risky
+    :return: a generator of (cushion, risky weight, account value, floor, peak) arrays, one per step
+    """
+    steps, n_scenarios = risky.shape
+    safe = np.broadcast_to(np.asarray(safe, dtype=float), risky.shape)
+    account_value = np.full(n_scenarios, start_value, dtype=float)
+    floor_value = np.full(n_scenarios, start_value * cushion_ratio, dtype=float)
+    peak = np.full(n_scenarios, start_value, dtype=float)
 
     for step in range(steps):
         # If a drawdown is specified, re-calibrate the floor value
         if drawdown is not None:
-            peak = np.maximum(peak, account_value)
+            np.maximum(peak, account_value, out=peak)
             floor_value = peak * (1 - drawdown)
         cushion = (account_value - floor_value) / account_value
-        risky_weight = multiplier * cushion
-        risky_weight = np.minimum(risky_weight, 1)
-        risky_weight = np.maximum(risky_weight, 0)
+        risky_weight = np.clip(multiplier * cushion, 0, 1)
         safe_weight = 1 - risky_weight
         risky_alloc = account_value * risky_weight
         safe_alloc = account_value * safe_weight
         # recompute the new account value at the end of this step
-        account_value = risky_alloc * (1 + risky_returns.iloc[step]) + safe_alloc * (1 + safe_returns.iloc[step])
-
-        # save the histories for analysis and plotting
-        cushion_history.iloc[step] = cushion
-        risky_w_history.iloc[step] = risky_weight
-        account_history.iloc[step] = account_value
-        floorval_history.iloc[step] = floor_value
-        peak_history.iloc[step] = peak
-    risky_wealth = start_value * (1 + risky_returns).cumprod()
+        account_value = risky_alloc * (1 + risky[step]) + safe_alloc * (1 + safe[step])
+        yield cushion, risky_weight, account_value, floor_value, peak
+
+
+def _cppi_kernel(risky, safe, multiplier, cushion_ratio, drawdown, start_value):
+    """
+    Run CPPI on a (steps, scenarios) array of risky returns,
+    writing the histories into preallocated arrays.
+    Every operation writes into the history rows or into a few reusable row buffers,
+    so no temporary arrays are allocated inside the time loop.
+    :return: a dictionary of (steps, scenarios) arrays
+    """
+    steps, n_scenarios = risky.shape
+    safe = np.broadcast_to(np.asarray(safe, dtype=float), risky.shape)
+    account_history = np.empty(risky.shape)
+    risky_w_history = np.empty(risky.shape)
+    cushion_history = np.empty(risky.shape)
+    floorval_history = np.empty(risky.shape)
+    peak_history = np.empty(risky.shape)
+    if drawdown is None:
+        # the peak and the floor never change
+        peak_history.fill(start_value)
+        floorval_history.fill(start_value * cushion_ratio)
+    risky_alloc, safe_alloc, growth = np.empty((3, n_scenarios))
+    account_value = np.full(n_scenarios, start_value, dtype=float)
+    peak = account_value
+    for step in range(steps):
+        floor_value = floorval_history[step]
+        if drawdown is not None:
+            # re-calibrate the floor value to the peak
+            peak = np.maximum(peak, account_value, out=peak_history[step])
+            np.multiply(peak, 1 - drawdown, out=floor_value)
+        cushion = np.subtract(account_value, floor_value, out=cushion_history[step])
+        cushion /= account_value
+        risky_weight = np.multiply(multiplier, cushion, out=risky_w_history[step])
+        np.clip(risky_weight, 0, 1, out=risky_weight)
+        np.multiply(account_value, risky_weight, out=risky_alloc)
+        np.subtract(1, risky_weight, out=safe_alloc)
+        safe_alloc *= account_value
+        # recompute the new account value at the end of this step
+        risky_alloc *= np.add(1, risky[step], out=growth)
+        safe_alloc *= np.add(1, safe[step], out=growth)
+        account_value = np.add(risky_alloc, safe_alloc, out=account_history[step])
     return {
         "wealth": account_history,
-        "risky_wealth": risky_wealth,
         "risk_budget": cushion_history,
         "risky_allocation": risky_w_history,
         "peak": peak_history,
@@ -100,7 +166,126 @@ def backtest_cppi(risky_returns,
 
 
 def cppi_monte_carlo(scenarios=50, mu=0.07, sigma=0.15,
-                     multiplier=3, cushion_ratio=0.0, risk_free_rate=0.03, start_value=1000):
-    risky_returns = geometric_brownian_motion(scenarios=scenarios, mu=mu, sigma=sigma, prices=False)
+                     multiplier=3, cushion_ratio=0.0, risk_free_rate=0.03, start_value=1000,
+                     years=10, seed=None, antithetic=False, sobol=False):
+    risky_returns = geometric_brownian_motion(scenarios=scenarios, mu=mu, sigma=sigma, years=years, prices=False,
+                                              seed=seed, antithetic=antithetic, sobol=sobol)
     return backtest_cppi(risky_returns=risky_returns, risk_free_rate=risk_free_rate,
                          multiplier=multiplier, start_value=start_value, cushion_ratio=cushion_ratio)
+
+
+class CppiSummary:
+    """
+    Summary statistics of a Monte Carlo CPPI simulation
+    """
+
+    def __init__(self, terminal_wealth, terminal_floor, breached, paths=None):
+        self.terminal_wealth = terminal_wealth
+        self.terminal_floor = terminal_floor
+        self.breached = breached
+        self.paths = paths
+        shortfall = terminal_floor - terminal_wealth
+        is_short = shortfall > 0
+        self.floor_breach_probability = breached.mean()
+        self.terminal_shortfall_probability = is_short.mean()
+        self.expected_shortfall = shortfall[is_short].mean() if is_short.any() else 0.0
+
+    def __len__(self):
+        return len(self.terminal_wealth)
+
+    def terminal_wealth_quantiles(self, q=(0.05, 0.25, 0.5, 0.75, 0.95)):
+        """
+        Quantiles of the terminal wealth distribution
+        :param q: the quantiles to compute
+        :return: a Series of terminal wealth indexed by quantile
+        """
+        return pd.Series(np.quantile(self.terminal_wealth, q), index=q)
+
+    def as_series(self):
+        return pd.Series({
+            "mean_terminal_wealth": self.terminal_wealth.mean(),
+            "median_terminal_wealth": np.median(self.terminal_wealth),
+            "floor_breach_probability": self.floor_breach_probability,
+            "terminal_shortfall_probability": self.terminal_shortfall_probability,
+            "expected_shortfall": self.expected_shortfall
+        })
+
+
+def cppi_monte_carlo_batched(scenarios=100000, mu=0.07, sigma=0.15,
+                             multiplier=3, cushion_ratio=0.0, risk_free_rate=0.03, start_value=1000,
+                             years=10, steps_per_year=12, drawdown=None,
+                             chunk_size=10000, n_workers=None, seed=None,
+                             antithetic=False, sobol=False,
+                             full_paths=False):
+    """
+    Monte Carlo simulation of CPPI on GBM risky returns, generated and simulated in chunks.
+    Chunks are distributed over a process pool, each one with its own random stream
+    spawned from a single seed, so results do not depend on the number of workers.
+    Only O(scenarios) state is kept unless full paths are requested.
+    :param scenarios: total number of scenarios
+    :param mu: the mean drift of the risky asset
+    :param sigma: the volatility of the risky asset
+    :param multiplier: multiplier to allocate to risky asset
+    :param cushion_ratio: ratio of the wealth to protect
+    :param risk_free_rate: annual rate of return of the safe asset
+    :param start_value: Initial monetary value of the account
+    :param years: number of years to simulate
+    :param steps_per_year: Number of periods per year
+    :param drawdown: max drawdown allowed (as ratio)
+    :param chunk_size: number of scenarios generated and simulated at once
+    :param n_workers: number of processes. None uses all cores, 1 runs in this process
+    :param seed: seed or numpy.random.Generator from which the generator of each chunk is spawned
+    :param antithetic: use antithetic variates within each chunk if True
+    :param sobol: draw the shocks of each chunk from a scrambled Sobol sequence if True
+    :param full_paths: also return the backtest histories of every scenario if True
+    :rtype: CppiSummary
+    :return: the summary of the simulation
+    """
+    chunk_sizes = [min(chunk_size, scenarios - start) for start in range(0, scenarios, chunk_size)]
+    generators = spawn_generators(seed, len(chunk_sizes))
+    params = dict(mu=mu, sigma=sigma, multiplier=multiplier, cushion_ratio=cushion_ratio,
+                  risk_free_rate=risk_free_rate, start_value=start_value, years=years,
+                  steps_per_year=steps_per_year, drawdown=drawdown,
+                  antithetic=antithetic, sobol=sobol, full_paths=full_paths)
+    tasks = [(size, generator, params) for size, generator in zip(chunk_sizes, generators)]
+    if n_workers == 1 or len(tasks) == 1:
+        results = [_simulate_cppi_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_simulate_cppi_chunk, tasks))
+
+    terminal_wealth, terminal_floor, breached, chunk_paths = zip(*results)
+    paths = None
+    if full_paths:
+        paths = {key: pd.DataFrame(np.hstack([chunk[key] for chunk in chunk_paths]))
+                 for key in chunk_paths[0]}
+    return CppiSummary(np.concatenate(terminal_wealth),
+                       np.concatenate(terminal_floor),
+                       np.concatenate(breached),
+                       paths)
+
+
+def _simulate_cppi_chunk(task):
+    """
+    Generate one chunk of GBM returns and run CPPI on it
+    """
+    n_scenarios, generator, params = task
+    risky = geometric_brownian_motion(mu=params["mu"], sigma=params["sigma"],
+                                      years=params["years"], scenarios=n_scenarios,
+                                      steps_per_year=params["steps_per_year"], prices=False,
+                                      seed=generator, antithetic=params["antithetic"],
+                                      sobol=params["sobol"]).to_numpy()
+    safe = params["risk_free_rate"] / params["steps_per_year"]
+    args = (risky, safe, params["multiplier"], params["cushion_ratio"],
+            params["drawdown"], params["start_value"])
+    if params["full_paths"]:
+        history = _cppi_kernel(*args)
+        history["risky_wealth"] = params["start_value"] * np.cumprod(1 + risky, axis=0)
+        breached = (history["wealth"] < history["floor"]).any(axis=0)
+        return history["wealth"][-1], history["floor"][-1], breached, history
+
+    breached = np.zeros(n_scenarios, dtype=bool)
+    account_value = floor_value = np.full(n_scenarios, params["start_value"], dtype=float)
+    for _, _, account_value, floor_value, _ in _cppi_steps(*args):
+        breached |= account_value < floor_value
+    return account_value, np.broadcast_to(floor_value, account_value.shape).copy(), breached, None
@@ -1,5 +1,7 @@
 from enum import Enum
 
+import numpy as np
+import pandas as pd
 import statsmodels.api as sm
 
 from fintools.factor_data import *
@@ -11,6 +13,25 @@ class RegressionType(Enum):
     FIVE_FACTOR = 5
 
 
+def _factor_names(regression_type: RegressionType):
+    """
+    The explanatory variables of each regression type, in the order of the regression parameters
+    """
+    names = ['Mkt-RF', 'Alpha']
+    if regression_type is RegressionType.THREE_FACTOR or regression_type is RegressionType.FIVE_FACTOR:
+        names += ['HML', 'SMB']
+    if regression_type is RegressionType.FIVE_FACTOR:
+        names += ['RMW', 'CMA']
+    return names
+
+
+def _factor_design(fff, regression_type: RegressionType):
+    """
+    The design matrix of the regression, with a constant Alpha column
+    """
+    return fff.assign(Alpha=1.0)[_factor_names(regression_type)]
+
+
 def french_fama_regression(portfolio_returns, start_index, end_index,
                            fff_return=None,
                            regression_type: RegressionType = RegressionType.CAPM):
@@ -24,13 +45,171 @@ def french_fama_regression(portfolio_returns, start_index, end_index,
         fff_return = load_fff_returns_monthly()
     fff = fff_return[start_index:end_index]
     excess_returns = portfolio_returns[start_index:end_index] - fff[['RF']].values
-    excess_market = fff[['Mkt-RF']].copy()
-    factors = excess_market
-    factors['Alpha'] = 1
-    if regression_type is RegressionType.THREE_FACTOR or regression_type is RegressionType.FIVE_FACTOR:
-        factors['HML'] = fff[['HML']]
-        factors['SMB'] = fff[['SMB']]
-    if regression_type is RegressionType.FIVE_FACTOR:
-        factors['RMW'] = fff[['RMW']]
-        factors['CMA'] = fff[['CMA']]
+    factors = _factor_design(fff, regression_type)
     return sm.OLS(excess_returns, factors).fit()
+
+
+class FactorRegression:
+    """
+    The results of regressing many return series on the same factors.
+    Each attribute has one row per return series.
+    """
+
+    def __init__(self, params, t_stats, r_squared, n_observations):
+        """
+        :param params: Data Frame of the regression coefficients: Alpha and the factor betas
+        :param t_stats: Data Frame of the t statistics of the coefficients
+        :param r_squared: Series of the R squared of each regression
+        :param n_observations: Series of the number of periods used by each regression
+        """
+        self.params = params
+        self.t_stats = t_stats
+        self.r_squared = r_squared
+        self.n_observations = n_observations
+
+    @property
+    def alphas(self):
+        return self.params['Alpha']
+
+    @property
+    def betas(self):
+        return self.params.drop(columns='Alpha')
+
+    def __len__(self):
+        return len(self.params)
+
+    def as_data_frame(self):
+        return pd.concat([self.params, self.t_stats.add_prefix('t_'), self.r_squared.rename('R2')], axis=1)
+
+
+def _least_squares(design, returns):
+    """
+    Solve the regressions of all the columns of returns on the same design matrix at once
+    :return: the coefficients, their t statistics and the R squared, one column per regression
+    """
+    n, k = design.shape
+    coefficients, _, _, _ = np.linalg.lstsq(design, returns, rcond=None)
+    residuals = returns - design @ coefficients
+    residual_sum_of_squares = (residuals ** 2).sum(axis=0)
+    standard_errors = np.sqrt(np.outer(np.diag(np.linalg.inv(design.T @ design)),
+                                       residual_sum_of_squares / (n - k)))
+    deviations = returns - returns.mean(axis=0)
+    r_squared = 1 - residual_sum_of_squares / (deviations ** 2).sum(axis=0)
+    return coefficients, coefficients / standard_errors, r_squared
+
+
+def french_fama_regressions(portfolio_returns: pd.DataFrame, start_index, end_index,
+                            fff_return=None,
+                            regression_type: RegressionType = RegressionType.CAPM):
+    """
+    Regress every column of a returns Data Frame on the FFF parameters.
+    The columns with the same missing periods share one least squares solve of the common factor design matrix.
+    :param portfolio_returns: Data Frame of returns, one column per portfolio
+    :param start_index: first period of the regressions
+    :param end_index: last period of the regressions
+    :param fff_return: the Fama-French factors. Default is load_fff_returns_monthly()
+    :param regression_type: the factors of the regressions, as in french_fama_regression
+    :return: a FactorRegression with one row per column of the returns
+    """
+    if fff_return is None:
+        fff_return = load_fff_returns_monthly()
+    fff = fff_return[start_index:end_index]
+    excess_returns = portfolio_returns[start_index:end_index].sub(fff['RF'], axis=0)
+    design = _factor_design(fff, regression_type).loc[excess_returns.index].to_numpy(dtype=float)
+    values = excess_returns.to_numpy(dtype=float)
+    names = _factor_names(regression_type)
+    n_assets = values.shape[1]
+    params = np.full((n_assets, len(names)), np.nan)
+    t_stats = np.full((n_assets, len(names)), np.nan)
+    r_squared = np.full(n_assets, np.nan)
+    n_observations = np.zeros(n_assets, dtype=int)
+    # group the columns by their pattern of missing returns
+    observed = ~np.isnan(values)
+    if observed.all():
+        groups = np.zeros(n_assets, dtype=int)
+        patterns = [np.ones(len(values), dtype=bool)]
+    else:
+        packed, groups = np.unique(np.packbits(observed, axis=0), axis=1, return_inverse=True)
+        patterns = np.unpackbits(packed, axis=0, count=len(values)).astype(bool).T
+    for group, rows in enumerate(patterns):
+        columns = np.flatnonzero(groups.ravel() == group)
+        if rows.sum() <= len(names):
+            continue
+        coefficients, t, r2 = _least_squares(design[rows], values[np.ix_(rows, columns)])
+        params[columns] = coefficients.T
+        t_stats[columns] = t.T
+        r_squared[columns] = r2
+        n_observations[columns] = rows.sum()
+    index = excess_returns.columns
+    return FactorRegression(pd.DataFrame(params, index=index, columns=names),
+                            pd.DataFrame(t_stats, index=index, columns=names),
+                            pd.Series(r_squared, index=index),
+                            pd.Series(n_observations, index=index))
+
+
+def rolling_french_fama_regression(portfolio_returns, window=60,
+                                   fff_return=None,
+                                   regression_type: RegressionType = RegressionType.CAPM,
+                                   expanding=False,
+                                   start_index=None, end_index=None):
+    """
+    Regress returns on the FFF parameters over rolling (or expanding) windows.
+    The sufficient statistics X'X and X'y are updated as the window slides, instead of refitting each window,
+    and all the windows are solved in one batched call.
+    :param portfolio_returns: Series or Data Frame of returns, one column per portfolio
+    :param window: number of periods of each regression, or the minimum number of periods if expanding
+    :param fff_return: the Fama-French factors. Default is load_fff_returns_monthly()
+    :param regression_type: the factors of the regressions, as in french_fama_regression
+    :param expanding: if True, each regression uses all the periods up to its end
+    :param start_index: optional first period
+    :param end_index: optional last period
+    :return: a dictionary with a Data Frame of coefficients for Alpha and each factor,
+    indexed by the last period of each window. Windows with missing returns have no coefficients
+    """
+    if fff_return is None:
+        fff_return = load_fff_returns_monthly()
+    returns = portfolio_returns.to_frame() if isinstance(portfolio_returns, pd.Series) else portfolio_returns
+    returns = returns[start_index:end_index]
+    fff = fff_return.reindex(returns.index).dropna()
+    returns = returns.loc[fff.index]
+    values = returns.sub(fff['RF'], axis=0).to_numpy(dtype=float)
+    design = _factor_design(fff, regression_type).to_numpy(dtype=float)
+    observed = ~np.isnan(values)
+    values = np.where(observed, values, 0.)
+    n_periods, n_factors = design.shape
+    cross_xx = np.zeros((n_factors, n_factors))
+    cross_xy = np.zeros((n_factors, values.shape[1]))
+    missing = np.zeros(values.shape[1], dtype=int)
+    ends = range(window - 1, n_periods)
+    windows_xx = np.empty((len(ends), n_factors, n_factors))
+    windows_xy = np.empty((len(ends), n_factors, values.shape[1]))
+    windows_missing = np.empty((len(ends), values.shape[1]), dtype=bool)
+    updates = 0
+    for t in range(n_periods):
+        start = 0 if expanding else max(t - window + 1, 0)
+        if not expanding and updates >= window:
+            # recompute from scratch once per window length, to stop rounding errors from accumulating
+            cross_xx = design[start:t + 1].T @ design[start:t + 1]
+            cross_xy = design[start:t + 1].T @ values[start:t + 1]
+            missing = (~observed[start:t + 1]).sum(axis=0)
+            updates = 0
+        else:
+            cross_xx += np.outer(design[t], design[t])
+            cross_xy += np.outer(design[t], values[t])
+            missing += ~observed[t]
+            if start > 0:
+                cross_xx -= np.outer(design[start - 1], design[start - 1])
+                cross_xy -= np.outer(design[start - 1], values[start - 1])
+                missing -= ~observed[start - 1]
+                updates += 1
+        if t >= window - 1:
+            windows_xx[t - window + 1] = cross_xx
+            windows_xy[t - window + 1] = cross_xy
+            windows_missing[t - window + 1] = missing > 0
+    coefficients = np.full((n_periods, n_factors, values.shape[1]), np.nan)
+    if len(ends) > 0:
+        solved = np.linalg.solve(windows_xx, windows_xy)
+        solved[np.broadcast_to(windows_missing[:, np.newaxis, :], solved.shape)] = np.nan
+        coefficients[window - 1:] = solved
+    return {name: pd.DataFrame(coefficients[:, k, :], index=returns.index, columns=returns.columns)
+            for k, name in enumerate(_factor_names(regression_type))}
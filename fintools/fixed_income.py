@@ -1,6 +1,9 @@
 import numpy as np
 import pandas as pd
 
+from fintools.random_sampling import make_generator, standard_normal
+from fintools.short_rate import CirModel
+
 
 def funding_ratio(assets: float, liabilities: pd.Series, risk_free_rate: float):
     """
@@ -119,7 +122,11 @@ def simulate_cir(a, b, sigma,
                  n_years: int = 10,
                  n_scenarios: int = 1,
                  steps_per_year: int = 12,
-                 initial_rate: float = None):
+                 initial_rate: float = None,
+                 seed=None,
+                 antithetic: bool = False,
+                 sobol: bool = False,
+                 exact: bool = False):
     """
     CIR model for interest rates
     :param a: mean reverting rate
@@ -129,6 +136,11 @@ def simulate_cir(a, b, sigma,
     :param n_scenarios: number of scenarios
     :param steps_per_year: time steps per year
     :param initial_rate: initial rate of return
+    :param seed: seed or numpy.random.Generator for the shocks
+    :param antithetic: use antithetic variates if True
+    :param sobol: draw the shocks from a scrambled Sobol sequence if True
+    :param exact: sample the exact non-central chi-square transitions instead of the Euler scheme.
+        The shock options do not apply in this case. See also fintools.short_rate
     :return:
     """
     if initial_rate is None:
@@ -137,13 +149,15 @@ def simulate_cir(a, b, sigma,
     initial_rate = annual_to_inst(initial_rate)
     dt = 1 / steps_per_year
     n_steps = int(n_years * steps_per_year) + 1
-    shock = np.random.normal(0, scale=np.sqrt(dt), size=(n_steps, n_scenarios))
+    if exact:
+        rates = CirModel(a, b, sigma, initial_rate).simulate_rates(n_steps - 1, dt, n_scenarios, make_generator(seed))
+        return pd.DataFrame(data=inst_to_annual(rates), index=range(n_steps))
+    shock = np.sqrt(dt) * standard_normal(n_steps, n_scenarios, seed=seed, antithetic=antithetic, sobol=sobol)
     rates = np.empty_like(shock)
     rates[0] = initial_rate
 
     for step in range(1, n_steps):
         r_t = rates[step - 1]
-        # TODO: optionally remove sqrt to simulate Vasicek model
         dr_t = a * (b - r_t) * dt + sigma * np.sqrt(r_t) * shock[step]
         rates[step] = abs(r_t + dr_t)
     return pd.DataFrame(data=inst_to_annual(rates), index=range(n_steps))
@@ -3,7 +3,8 @@ import numpy as np
 import pandas as pd
 from scipy.stats import norm, skew, kurtosis
 
-from fintools import annualize_returns, annualize_volatility, annualized_sharpe_ratio, compute_compound_return
+from fintools.calculator import annualize_returns, annualize_volatility, annualized_sharpe_ratio, \
+    compute_compound_return
 
 
 def semi_deviation(returns: pd.DataFrame):
@@ -59,6 +60,152 @@ def conditional_VaR(returns, confidence_level=5):
     return -returns[is_beyond].mean()
 
 
+def _as_frame_values(returns):
+    values = returns.to_frame() if isinstance(returns, pd.Series) else returns
+    return values.to_numpy(dtype=float)
+
+
+def _wrap_rolling(returns, values):
+    if isinstance(returns, pd.Series):
+        return pd.Series(values[:, 0], index=returns.index, name=returns.name)
+    return pd.DataFrame(values, index=returns.index, columns=returns.columns)
+
+
+def _lerp(low, high, fraction):
+    """
+    Linear interpolation rounded as in numpy.percentile
+    """
+    difference = high - low
+    return np.where(fraction >= 0.5, high - difference * (1 - fraction), low + difference * fraction)
+
+
+def _incomplete_windows(missing, window):
+    """
+    Flag the windows that end at each period and contain a missing return
+    """
+    counts = np.cumsum(missing, axis=0)
+    counts[window:] -= counts[:-window].copy()
+    return counts > 0
+
+
+def _rolling_tail(values, window, confidence_level):
+    """
+    The rolling percentile of each column, and the mean of the values at or below it.
+    Each window is kept sorted: at every step the oldest return is deleted and the newest one inserted,
+    for all the columns at once. Windows with missing returns are NaN.
+    :return: two (T, N) arrays: the percentiles and the tail means
+    """
+    n_periods, n_columns = values.shape
+    quantiles = np.full((n_periods, n_columns), np.nan)
+    tail_means = np.full((n_periods, n_columns), np.nan)
+    if n_periods < window:
+        return quantiles, tail_means
+    # missing returns sort after every other return, and their windows are discarded
+    missing = np.isnan(values)
+    values = np.where(missing, np.inf, values)
+    position = (window - 1) * confidence_level / 100
+    low = int(np.floor(position))
+    high = min(low + 1, window - 1)
+    fraction = position - low
+    columns = np.arange(window)
+    rows = np.arange(n_columns)
+    ordered = np.sort(values[:window].T, axis=1)
+    for t in range(window - 1, n_periods):
+        if t >= window:
+            deleted = (ordered < values[t - window].reshape(-1, 1)).sum(axis=1)
+            inserted = (ordered < values[t].reshape(-1, 1)).sum(axis=1)
+            inserted -= inserted > deleted
+            # shift the entries between the deleted and the inserted positions by one place
+            source = columns - (columns > inserted.reshape(-1, 1))
+            source += source >= deleted.reshape(-1, 1)
+            ordered = np.take_along_axis(ordered, np.minimum(source, window - 1), axis=1)
+            ordered[rows, inserted] = values[t]
+        quantile = _lerp(ordered[:, low], ordered[:, high], fraction)
+        is_beyond = ordered <= quantile.reshape(-1, 1)
+        quantiles[t] = quantile
+        tail_means[t] = np.where(is_beyond, ordered, 0).sum(axis=1) / is_beyond.sum(axis=1)
+    incomplete = _incomplete_windows(missing, window)
+    quantiles[incomplete] = np.nan
+    tail_means[incomplete] = np.nan
+    return quantiles, tail_means
+
+
+def rolling_historic_VaR(returns, window, confidence_level=5):
+    """
+    Historic Value at Risk over a rolling window, as historic_VaR of each window
+    :param returns: Series or Data Frame of returns, one column per asset
+    :param window: number of periods of each window
+    :param confidence_level: percentile at which to calculate VaR
+    :return: Series or Data Frame of VaR, indexed by the last period of each window
+    """
+    quantiles, _ = _rolling_tail(_as_frame_values(returns), window, confidence_level)
+    return _wrap_rolling(returns, -quantiles)
+
+
+def rolling_conditional_VaR(returns, window, confidence_level=5):
+    """
+    Conditional Value at Risk over a rolling window, as conditional_VaR of each window
+    :param returns: Series or Data Frame of returns, one column per asset
+    :param window: number of periods of each window
+    :param confidence_level: percentile at which to calculate VaR
+    :return: Series or Data Frame of CVaR, indexed by the last period of each window
+    """
+    _, tail_means = _rolling_tail(_as_frame_values(returns), window, confidence_level)
+    return _wrap_rolling(returns, -tail_means)
+
+
+def rolling_semi_deviation(returns, window):
+    """
+    Semi-deviation over a rolling window, as semi_deviation of each window
+    :param returns: Series or Data Frame of returns, one column per asset
+    :param window: number of periods of each window
+    :return: Series or Data Frame of semi-deviations, indexed by the last period of each window
+    """
+    result = returns[returns < 0].rolling(window, min_periods=1).std(ddof=0)
+    incomplete = returns.isna().rolling(window, min_periods=window).sum() != 0
+    return result.mask(incomplete)
+
+
+def rolling_max_drawdown(returns, window):
+    """
+    Maximum drawdown over a rolling window, as compute_drawdown(...).max_drawdown of each window.
+    The series is cut in blocks of one window length, so that every window is the end of one block
+    followed by the start of the next: the drawdowns of the block prefixes and suffixes are running
+    maxima and minima of the log wealth, and the whole calculation is independent of the window length.
+    :param returns: Series or Data Frame of returns, one column per asset
+    :param window: number of periods of each window
+    :return: Series or Data Frame of maximum drawdowns, indexed by the last period of each window
+    """
+    values = _as_frame_values(returns)
+    n_periods, n_columns = values.shape
+    result = np.full((n_periods, n_columns), np.nan)
+    if n_periods >= window:
+        missing = np.isnan(values)
+        log_wealth = np.cumsum(np.log1p(np.where(missing, 0, values)), axis=0)
+        n_blocks = -(-n_periods // window)
+        padded = np.pad(log_wealth, ((0, n_blocks * window - n_periods), (0, 0)), mode='edge')
+        blocks = padded.reshape(n_blocks, window, n_columns)
+        # deepest fall from a running peak from the start of each block up to each period
+        prefix_peaks = np.maximum.accumulate(blocks, axis=1)
+        prefix_drawdowns = np.maximum.accumulate(prefix_peaks - blocks, axis=1).reshape(-1, n_columns)
+        prefix_troughs = np.minimum.accumulate(blocks, axis=1).reshape(-1, n_columns)
+        # deepest fall from each period up to the end of its block
+        reverse = blocks[:, ::-1]
+        suffix_troughs = np.minimum.accumulate(reverse, axis=1)
+        suffix_drawdowns = np.maximum.accumulate(reverse - suffix_troughs, axis=1)[:, ::-1].reshape(-1, n_columns)
+        suffix_peaks = np.maximum.accumulate(reverse, axis=1)[:, ::-1].reshape(-1, n_columns)
+        ends = np.arange(window - 1, n_periods)
+        starts = ends - window + 1
+        drawdowns = np.maximum(np.maximum(suffix_drawdowns[starts], prefix_drawdowns[ends]),
+                               suffix_peaks[starts] - prefix_troughs[ends])
+        # windows that are exactly one block
+        aligned = starts % window == 0
+        drawdowns[aligned] = suffix_drawdowns[starts[aligned]]
+        result[window - 1:] = np.expm1(-drawdowns)
+        result[_incomplete_windows(missing, window)] = np.nan
+    return _wrap_rolling(returns, result)
+
+
 def compute_drawdown(returns: pd.Series, initial_wealth=1000):
     """
     Takes a time series of asset returns
@@ -94,12 +241,91 @@ class Drawdown:
         return self.__df
 
 
+def _zero_out_rounding_errors(values):
+    """
+    Sums of squares below 1e-14 are treated as zero by the pandas moments
+    """
+    return np.where(np.abs(values) < 1e-14, 0, values)
+
+
+def _fused_metrics(values, risk_free_rate, periods_in_year=12):
+    """
+    Compute the summary stats of collect_metrics for every column of a (T, N) array without missing values,
+    in a few vectorized passes: a cumulative product for the drawdowns and the growth,
+    the centered moments, and one percentile for the historic VaR.
+    The moments follow the conventions of the pandas (skew, kurt) and scipy (Cornish-Fisher VaR) estimators.
+    """
+    n = len(values)
+    wealth = np.cumprod(1 + values, axis=0)
+    peaks = np.maximum.accumulate(wealth, axis=0)
+    max_drawdown = ((wealth - peaks) / peaks).min(axis=0)
+    annualized_return = wealth[-1] ** (periods_in_year / n) - 1
+    compound_return = wealth[-1] - 1
+
+    mean = values.sum(axis=0) / n
+    deviations = values - mean
+    squared = deviations ** 2
+    m2 = squared.sum(axis=0)
+    m3 = (squared * deviations).sum(axis=0)
+    m4 = (squared ** 2).sum(axis=0)
+    volatility = np.sqrt(m2 / (n - 1))
+    annualized_volatility = volatility * np.sqrt(periods_in_year)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # pandas: adjusted Fisher-Pearson skewness and unbiased excess kurtosis
+        m2_pandas = _zero_out_rounding_errors(m2)
+        skewness = (n * (n - 1) ** 0.5 / (n - 2)) * (_zero_out_rounding_errors(m3) / m2_pandas ** 1.5)
+        skewness = np.where(m2_pandas == 0, 0, skewness)
+        numerator = _zero_out_rounding_errors(n * (n + 1) * (n - 1) * m4)
+        denominator = _zero_out_rounding_errors((n - 2) * (n - 3) * m2 ** 2)
+        excess_kurtosis = numerator / denominator - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+        excess_kurtosis = np.where(denominator == 0, 0, excess_kurtosis)
+
+        # scipy: biased skewness and unbiased excess kurtosis, undefined for constant returns
+        constant = m2 / n <= (np.finfo(float).resolution * mean) ** 2
+        biased_skewness = np.where(constant, np.nan, (m3 / n) / (m2 / n) ** 1.5)
+        ratio = (m4 / n) / (m2 / n) ** 2
+        unbiased_kurtosis = np.where(constant, np.nan,
+                                     ((n ** 2 - 1) * ratio - 3 * (n - 1) ** 2) / ((n - 2) * (n - 3)))
+    z = norm.ppf(0.05)
+    z += (z ** 2 - 1) * biased_skewness / 6 + (z ** 3 - 3 * z) * unbiased_kurtosis / 24 \
+        - (2 * z ** 3 - 5 * z) * (biased_skewness ** 2) / 36
+    cornish_fisher_var = -(mean + z * np.sqrt(m2 / n))
+
+    historic_var = -np.percentile(values, 5, axis=0)
+    is_beyond = values <= -historic_var
+    conditional_var = -np.where(is_beyond, values, 0).sum(axis=0) / is_beyond.sum(axis=0)
+
+    return {
+        "compound_return": compound_return,
+        "annualized_return": annualized_return,
+        "annualized_volatility": annualized_volatility,
+        "skewness": skewness,
+        "excess_kurtosis": excess_kurtosis,
+        "cornish_fisher_var": cornish_fisher_var,
+        "historic_var": historic_var,
+        "conditional_var": conditional_var,
+        "sharpe_ratio": (annualized_return - risk_free_rate) / annualized_volatility,
+        "max_drawdown": max_drawdown
+    }
+
+
 def collect_metrics(returns, risk_free_rate=0.0):
     """
-    Return a DataFrame that contains aggregated summary stats for the returns
+    Return a DataFrame that contains aggregated summary stats for the returns.
+    Returns without missing values are summarized for all the columns at once by a fused kernel.
     :param: returns: A vector or Data Frame of returns
     :param: risk_free_rate: The risk free rate (constant)
     """
+    if isinstance(returns, (pd.DataFrame, pd.Series)) and len(returns) >= 4:
+        values = returns.to_numpy(dtype=float)
+        if not np.isnan(values).any():
+            if isinstance(returns, pd.DataFrame):
+                result = _fused_metrics(values, risk_free_rate)
+                return pd.DataFrame(result, index=returns.columns)
+            result = _fused_metrics(values.reshape(-1, 1), risk_free_rate)
+            return pd.Series({name: metric[0] for name, metric in result.items()})
+
     compound_return = compute_compound_return(returns)
     annualized_return = returns.aggregate(annualize_returns, periods_in_year=12)
     annualized_volatility = returns.aggregate(annualize_volatility, periods_in_year=12)
@@ -128,4 +354,263 @@ def collect_metrics(returns, risk_free_rate=0.0):
     elif isinstance(returns, pd.Series):
         return pd.Series(result)
     else:
-        return result
\ No newline at end of file
+        return result
+
+
+def _merge_moments(count, mean, m2, m3, m4, batch_count, batch_mean, batch_m2, batch_m3, batch_m4):
+    """
+    Combine the central moment sums of two sets of observations (Chan et al. and Terriberry).
+    An empty batch leaves the moments unchanged, whatever its mean.
+    """
+    total = count + batch_count
+    inverse = 1 / np.maximum(total, 1)
+    delta = batch_mean - mean
+    delta_weight = delta * batch_count * inverse
+    product = count * batch_count * inverse
+    merged_m2 = m2 + batch_m2 + delta * delta_weight * count
+    merged_m3 = (m3 + batch_m3 + delta ** 3 * product * (count - batch_count) * inverse
+                 + 3 * delta * (count * batch_m2 - batch_count * m2) * inverse)
+    merged_m4 = (m4 + batch_m4
+                 + delta ** 4 * product * (count ** 2 - count * batch_count + batch_count ** 2) * inverse ** 2
+                 + 6 * delta ** 2 * (count ** 2 * batch_m2 + batch_count ** 2 * m2) * inverse ** 2
+                 + 4 * delta * (count * batch_m3 - batch_count * m3) * inverse)
+    return total, mean + delta_weight, merged_m2, merged_m3, merged_m4
+
+
+def _batch_moments(values, mask=None):
+    """
+    Count, mean and central moment sums of each column of a batch, over the masked values only if a mask is supplied
+    """
+    if len(values) == 1:
+        # a single period has no dispersion
+        row, zeros = values[0], np.zeros(values.shape[1])
+        count = np.ones(len(row)) if mask is None else mask[0].astype(float)
+        return count, row * count, zeros, zeros, zeros
+    if mask is None:
+        count = np.full(values.shape[1], len(values))
+        mean = values.mean(axis=0)
+        deviations = values - mean
+    else:
+        count = mask.sum(axis=0)
+        mean = np.where(mask, values, 0).sum(axis=0) / np.maximum(count, 1)
+        deviations = np.where(mask, values - mean, 0)
+    squared = deviations ** 2
+    return count, mean, squared.sum(axis=0), (squared * deviations).sum(axis=0), (squared ** 2).sum(axis=0)
+
+
+class _TDigest:
+    """
+    Merging t-digest sketch of the distribution of each column of a stream (Dunning and Ertl, 2019).
+    Incoming values are buffered and merged into at most about compression / 2 centroids per column,
+    with the centroids in the tails kept small, so the extreme quantiles stay accurate.
+    """
+
+    def __init__(self, n_columns, compression=200, buffer_size=1000):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.means = [np.empty(0) for _ in range(n_columns)]
+        self.weights = [np.empty(0) for _ in range(n_columns)]
+        self.__buffer = []
+        self.__buffered = 0
+
+    def update(self, values):
+        self.__buffer.append(values)
+        self.__buffered += len(values)
+        if self.__buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.__buffer:
+            return
+        values = np.concatenate(self.__buffer)
+        self.__buffer = []
+        self.__buffered = 0
+        for j in range(values.shape[1]):
+            means = np.concatenate([self.means[j], values[:, j]])
+            weights = np.concatenate([self.weights[j], np.ones(len(values))])
+            order = np.argsort(means, kind='stable')
+            means, weights = means[order], weights[order]
+            left = (np.cumsum(weights) - weights) / weights.sum()
+            # arcsine scale function: each centroid spans at most one unit of k
+            k = np.floor(self.compression / (2 * np.pi) * (np.arcsin(2 * left - 1) + np.pi / 2))
+            starts = np.flatnonzero(np.diff(k, prepend=-1))
+            self.weights[j] = np.add.reduceat(weights, starts)
+            self.means[j] = np.add.reduceat(weights * means, starts) / self.weights[j]
+
+    def quantile(self, q):
+        """
+        The q quantile of each column, interpolated between the centroids as numpy.percentile interpolates
+        between the sorted values: the two coincide while every centroid holds a single value
+        """
+        self.flush()
+        result = np.full(len(self.means), np.nan)
+        for j, (means, weights) in enumerate(zip(self.means, self.weights)):
+            if len(means) > 0:
+                ranks = np.cumsum(weights) - (weights + 1) / 2
+                result[j] = np.interp(q * (weights.sum() - 1), ranks, means)
+        return result
+
+    def tail_mean(self, threshold):
+        """
+        The mean of the values at or below the threshold of each column
+        """
+        self.flush()
+        result = np.full(len(self.means), np.nan)
+        for j, (means, weights) in enumerate(zip(self.means, self.weights)):
+            is_beyond = means <= threshold[j]
+            if is_beyond.any():
+                result[j] = (weights[is_beyond] * means[is_beyond]).sum() / weights[is_beyond].sum()
+        return result
+
+
+class RiskAccumulator:
+    """
+    Online risk metrics of one or more streams of returns.
+    Returns are added one period or one batch at a time, and the metrics are available at any time
+    at a cost that does not grow with the length of the history:
+    - the moments are merged with the Welford / Chan et al. updates
+    - the drawdowns follow the running wealth and peak
+    - the historic VaR and conditional VaR come from a t-digest sketch of the returns,
+      exact while the stream is short and approximate (mostly in the body of the distribution) afterwards
+    """
+
+    def __init__(self, columns=None, confidence_level=5, initial_wealth=1000, compression=200):
+        """
+        :param columns: the names of the streams. If None, there is a single stream
+        :param confidence_level: percentile at which to calculate VaR and CVaR
+        :param initial_wealth: initial wealth invested
+        :param compression: accuracy of the quantile sketch, about twice the number of centroids kept per stream
+        """
+        self.columns = columns
+        self.confidence_level = confidence_level
+        self.initial_wealth = initial_wealth
+        n = 1 if columns is None else len(columns)
+        zeros = np.zeros(n)
+        self.__moments = (zeros, zeros, zeros, zeros, zeros)
+        self.__negative_moments = (zeros, zeros, zeros, zeros, zeros)
+        self.__digest = _TDigest(n, compression)
+        self.__wealth = np.full(n, float(initial_wealth))
+        self.__peak = self.__wealth.copy()
+        self.__max_drawdown = zeros
+
+    def __len__(self):
+        return int(self.__moments[0][0])
+
+    def update(self, returns):
+        """
+        Add the returns of one period, or a batch of periods
+        :param returns: a scalar or a vector of returns for a single stream,
+        a vector (one period) or a (T, N) array or Data Frame for N streams
+        """
+        if self.columns is not None and isinstance(returns, pd.DataFrame):
+            returns = returns[self.columns]
+        elif self.columns is not None and isinstance(returns, pd.Series):
+            returns = returns.reindex(self.columns)
+        values = np.asarray(returns, dtype=float).reshape(-1, len(self.__moments[0]))
+        if len(values) == 0:
+            return self
+        self.__moments = _merge_moments(*self.__moments, *_batch_moments(values))
+        self.__negative_moments = _merge_moments(*self.__negative_moments, *_batch_moments(values, values < 0))
+        wealth = self.__wealth * np.cumprod(1 + values, axis=0)
+        peaks = np.maximum(self.__peak, np.maximum.accumulate(wealth, axis=0))
+        self.__max_drawdown = np.minimum(self.__max_drawdown, ((wealth - peaks) / peaks).min(axis=0))
+        self.__wealth = wealth[-1]
+        self.__peak = peaks[-1]
+        self.__digest.update(values)
+        return self
+
+    def __wrap(self, values):
+        if self.columns is None:
+            return values[0]
+        return pd.Series(values, index=self.columns)
+
+    @property
+    def mean(self):
+        return self.__wrap(self.__moments[1])
+
+    @property
+    def volatility(self):
+        count, _, m2, _, _ = self.__moments
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.__wrap(np.sqrt(m2 / (count - 1)))
+
+    @property
+    def skewness(self):
+        """
+        Adjusted Fisher-Pearson skewness, as pandas skew
+        """
+        n, _, m2, m3, _ = self.__moments
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.__wrap(np.sqrt(n * (n - 1)) / (n - 2) * (m3 / n) / (m2 / n) ** 1.5)
+
+    @property
+    def excess_kurtosis(self):
+        """
+        Unbiased excess kurtosis, as pandas kurt
+        """
+        n, _, m2, _, m4 = self.__moments
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.__wrap((n + 1) * n * (n - 1) * m4 / ((n - 2) * (n - 3) * m2 ** 2)
+                               - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3)))
+
+    @property
+    def semi_deviation(self):
+        count, _, m2, _, _ = self.__negative_moments
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.__wrap(np.sqrt(m2 / count))
+
+    @property
+    def parametric_var(self):
+        """
+        Cornish-Fisher VaR, as parametric_VaR
+        """
+        n, mean, m2, m3, m4 = self.__moments
+        z = norm.ppf(self.confidence_level / 100)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s = (m3 / n) / (m2 / n) ** 1.5
+            k = ((n ** 2 - 1) * (m4 / n) / (m2 / n) ** 2 - 3 * (n - 1) ** 2) / ((n - 2) * (n - 3))
+            z += (z ** 2 - 1) * s / 6 + (z ** 3 - 3 * z) * k / 24 - (2 * z ** 3 - 5 * z) * (s ** 2) / 36
+            return self.__wrap(-(mean + z * np.sqrt(m2 / n)))
+
+    @property
+    def historic_var(self):
+        return self.__wrap(-self.__digest.quantile(self.confidence_level / 100))
+
+    @property
+    def conditional_var(self):
+        threshold = self.__digest.quantile(self.confidence_level / 100)
+        return self.__wrap(-self.__digest.tail_mean(threshold))
+
+    @property
+    def wealth(self):
+        return self.__wrap(self.__wealth)
+
+    @property
+    def peak(self):
+        return self.__wrap(self.__peak)
+
+    @property
+    def max_drawdown(self):
+        return self.__wrap(self.__max_drawdown)
+
+    @property
+    def drawdown(self):
+        return self.__wrap((self.__wealth - self.__peak) / self.__peak)
+
+    @property
+    def compound_return(self):
+        return self.__wrap(self.__wealth / self.initial_wealth - 1)
+
+    def as_data_frame(self):
+        return pd.DataFrame({
+            "compound_return": np.atleast_1d(self.compound_return),
+            "volatility": np.atleast_1d(self.volatility),
+            "skewness": np.atleast_1d(self.skewness),
+            "excess_kurtosis": np.atleast_1d(self.excess_kurtosis),
+            "semi_deviation": np.atleast_1d(self.semi_deviation),
+            "cornish_fisher_var": np.atleast_1d(self.parametric_var),
+            "historic_var": np.atleast_1d(self.historic_var),
+            "conditional_var": np.atleast_1d(self.conditional_var),
+            "max_drawdown": np.atleast_1d(self.max_drawdown),
+            "drawdown": np.atleast_1d(self.drawdown)
+        }, index=self.columns)
@@ -4,6 +4,8 @@ import pandas as pd
 import numpy as np
 from scipy.optimize import minimize, LinearConstraint, Bounds
 
+from fintools.covariance import FactorCovariance
+
 
 def compute_portfolio_return(weights, returns):
     """
@@ -22,20 +24,63 @@ def compute_portfolio_variance(weights, covariance):
     """
     Compute the portfolio variance, given a covariance matrix
     :param weights: the weights of the portfolio
-    :param covariance: the covariance matrix
+    :param covariance: the covariance matrix, or a FactorCovariance
     :return: the portfolio variance
     """
     np_weights = np.array(weights)
+    if isinstance(covariance, FactorCovariance):
+        return covariance.portfolio_variance(np_weights) ** 0.5
     return (np_weights.T @ covariance @ np_weights) ** 0.5
 
 
+def portfolio_volatility_gradient(weights, covariance):
+    """
+    Gradient of the portfolio volatility with respect to the weights: Cov*w / sqrt(w'*Cov*w)
+    :param weights: the weights of the portfolio
+    :param covariance: the covariance matrix
+    :return: the gradient vector
+    """
+    np_weights = np.array(weights)
+    marginal = _as_covariance(covariance) @ np_weights
+    return marginal / (np_weights @ marginal) ** 0.5
+
+
+# eigenvalues below this fraction of the largest one are treated as zero
+_SINGULAR_TOLERANCE = 1e-12
+
+
+def _as_covariance(covariance):
+    """
+    Covariance matrices as arrays, factor covariances are kept in their structured form
+    """
+    if isinstance(covariance, FactorCovariance):
+        return covariance
+    return np.asarray(covariance, dtype=float)
+
+
+def _solve(covariance, rhs, assets=None):
+    """
+    Solve Cov * x = rhs for a vector or a (N, M) matrix, restricted to a subset of the assets if supplied.
+    A singular covariance (e.g. two identical assets) gets the minimum norm least squares solution.
+    """
+    if isinstance(covariance, FactorCovariance):
+        return (covariance if assets is None else covariance.subset(assets)).solve(rhs)
+    if assets is not None:
+        covariance = covariance[np.ix_(assets, assets)]
+    rhs = np.asarray(rhs, dtype=float)
+    if rhs.ndim > 1:
+        # the columns of a (N, M) matrix are solved as a stack of vectors
+        return batch_cholesky_solve(covariance, rhs.T).T
+    return batch_cholesky_solve(covariance, rhs)
+
+
 def minimize_volatility(target_return, expected_returns, covariance,
                         debug=False):
     """
     Find the weights that minimize variance at a specific return
     :param target_return: the target return
     :param expected_returns: the vector of expected returns for each asset
-    :param covariance: the covariance matrix of the assets
+    :param covariance: the covariance matrix of the assets, or a FactorCovariance
     :param debug: Display optimization details if True
     :return: the optimal weights
     """
@@ -46,13 +91,16 @@ def minimize_volatility(target_return, expected_returns, covariance,
     # constraints
     return_equals_to_target = {
         'type': 'eq',
-        'fun': lambda w: target_return - compute_portfolio_return(w, expected_returns)
+        'fun': lambda w: target_return - compute_portfolio_return(w, expected_returns),
+        'jac': lambda w: -np.asarray(expected_returns, dtype=float)
     }
     weights_sum_to_1 = {
         'type': 'eq',
-        'fun': lambda w: np.sum(w) - 1
+        'fun': lambda w: np.sum(w) - 1,
+        'jac': lambda w: np.ones(n)
     }
     solution = minimize(fun=compute_portfolio_variance,
+                        jac=portfolio_volatility_gradient,
                         method='SLSQP',
                         x0=initial_guess,
                         bounds=bounds,
@@ -68,26 +116,58 @@ def sharpe_ratio(weights, expected_returns, covariance, risk_free_rate=0):
     return -excess_return / volatility
 
 
+def sharpe_ratio_gradient(weights, expected_returns, covariance, risk_free_rate=0):
+    """
+    Gradient of the negative sharpe ratio with respect to the weights
+    :return: the gradient vector
+    """
+    excess_return = compute_portfolio_return(weights, expected_returns) - risk_free_rate
+    volatility = compute_portfolio_variance(weights, covariance)
+    volatility_gradient = portfolio_volatility_gradient(weights, covariance)
+    return -(np.asarray(expected_returns, dtype=float) - excess_return * volatility_gradient / volatility) / volatility
+
+
 def maximize_sharpe_ratio(expected_returns, covariance,
                           risk_free_rate=0,
                           targeted_annual_return=None,
-                          debug=False):
+                          debug=False,
+                          initial_weights=None,
+                          allow_short=False):
     """
-    Find the portfolio weights that maximize the sharpe ratio of excess returns
+    Find the portfolio weights that maximize the sharpe ratio of excess returns.
+    Without a target return the problem is solved directly: in closed form if shorting is allowed,
+    by an active set quadratic program for long only portfolios.
+    With a target return the sharpe ratio is maximized by the minimum variance portfolio at that return,
+    in closed form if shorting is allowed, otherwise with SLSQP.
     :param expected_returns: The vector of expected returns
-    :param covariance: The covariance matrix of assets
+    :param covariance: The covariance matrix of assets, or a FactorCovariance
     :param risk_free_rate: the risk free rate (default 0)
     :param targeted_annual_return: Optional target rate of return
     :param debug: Display optimization details if True
+    :param initial_weights: Optional starting point of the optimizer. Default is equal weights
+    :param allow_short: if True, the weights are unbounded
     :return: the optimal weights
     """
+    excess_returns = np.asarray(expected_returns, dtype=float) - risk_free_rate
+    if not targeted_annual_return:
+        if allow_short:
+            x = _solve(_as_covariance(covariance), excess_returns)
+            return x / x.sum()
+        if np.any(excess_returns > 0):
+            return _long_only_minimum_variance(covariance, excess_returns, initial_weights)
+    elif allow_short:
+        return _minimum_variance_at_return(covariance, expected_returns, targeted_annual_return)
 
     sharpe = partial(sharpe_ratio,
                      expected_returns=expected_returns,
                      covariance=covariance,
                      risk_free_rate=risk_free_rate)
+    sharpe_gradient = partial(sharpe_ratio_gradient,
+                              expected_returns=expected_returns,
+                              covariance=covariance,
+                              risk_free_rate=risk_free_rate)
     n = len(expected_returns)
-    guess = np.repeat(1 / n, n)
+    guess = np.repeat(1 / n, n) if initial_weights is None else initial_weights
     constraints = []
     fully_invested_constraint = LinearConstraint(np.ones(n), [1], [1])
     constraints.append(fully_invested_constraint)
@@ -95,6 +175,7 @@ def maximize_sharpe_ratio(expected_returns, covariance,
         constraints.append(LinearConstraint(expected_returns, [targeted_annual_return], [targeted_annual_return]))
     bounds = Bounds(np.zeros(n), np.ones(n))
     solution = minimize(sharpe,
+                        jac=sharpe_gradient,
                         method='SLSQP',
                         x0=guess,
                         constraints=constraints,
@@ -103,9 +184,385 @@ def maximize_sharpe_ratio(expected_returns, covariance,
     return solution.x
 
 
-def global_minimum_variance_portfolio(covariance):
+def _minimum_variance_at_return(covariance, expected_returns, target_return):
+    """
+    Minimum variance portfolio with unbounded weights at a target return:
+    w = inv(Cov)*(a*1 + b*mu), with a and b such that the weights sum to one and w'*mu = target_return
+    """
+    mean = np.asarray(expected_returns, dtype=float)
+    solved = _solve(_as_covariance(covariance), np.column_stack([np.ones(len(mean)), mean]))
+    constraints = np.vstack([solved.sum(axis=0), mean @ solved])
+    coefficients = np.linalg.solve(constraints, [1, target_return])
+    return solved @ coefficients
+
+
+def global_minimum_variance_portfolio(covariance, allow_short=False, initial_weights=None):
+    """
+    Find the portfolio with the lowest variance
+    :param covariance: The covariance matrix of assets, or a FactorCovariance
+    :param allow_short: if True, the weights are unbounded and inv(Cov)*1 / 1'*inv(Cov)*1.
+    Otherwise they are found by an active set quadratic program
+    :param initial_weights: Optional (long only) starting point of the active set solver
+    :return: the optimal weights
+    """
     n = covariance.shape[0]
-    return maximize_sharpe_ratio(np.repeat(1, n), covariance)
+    if allow_short:
+        x = _solve(_as_covariance(covariance), np.ones(n))
+        return x / x.sum()
+    return _long_only_minimum_variance(covariance, np.ones(n), initial_weights)
+
+
+def _long_only_minimum_variance(covariance, direction, initial_weights=None, tolerance=1e-12, max_iterations=None):
+    """
+    Primal active set solver of min y'*Cov*y subject to direction'*y = 1 and y >= 0.
+    With direction = 1 this is the long only GMV portfolio, with direction = mu - rf the solution
+    rescaled to sum to one is the long only maximum sharpe ratio portfolio.
+    :param covariance: the covariance matrix
+    :param direction: the vector of the equality constraint, with at least one positive element
+    :param initial_weights: optional long only starting weights, e.g. the previous solution
+    :return: the optimal weights, summing to one
+    """
+    covariance = _as_covariance(covariance)
+    direction = np.asarray(direction, dtype=float)
+    n = len(direction)
+    y = np.maximum(direction, 0)
+    if initial_weights is not None and direction @ np.maximum(initial_weights, 0) > 0:
+        y = np.maximum(initial_weights, 0)
+    y = y / (direction @ y)
+    free = y > 0
+    for _ in range(max_iterations or 10 * n):
+        covariance_inv_a = _solve(covariance, direction[free], free)
+        target = np.zeros(n)
+        target[free] = covariance_inv_a / (direction[free] @ covariance_inv_a)
+        blocking = free & (target < 0)
+        if not blocking.any():
+            y = target
+            # multipliers of the y >= 0 constraints: Cov*y - lambda*direction
+            multipliers = covariance @ y - direction / (direction[free] @ covariance_inv_a)
+            multipliers[free] = 0
+            release = np.argmin(multipliers)
+            if multipliers[release] >= -tolerance:
+                break
+            free[release] = True
+        else:
+            # move towards the target until the first weight hits zero
+            steps = y[blocking] / (y[blocking] - target[blocking])
+            step = steps.min()
+            y += step * (target - y)
+            bounded = np.flatnonzero(blocking)[np.argmin(steps)]
+            y[bounded] = 0
+            free[bounded] = False
+    y = np.maximum(y, 0)
+    return y / y.sum()
+
+
+def batch_cholesky_solve(covariances, rhs):
+    """
+    Solve the stacked (or single) systems covariances[k] @ x[k] = rhs[k] through the Cholesky factors.
+    If any of the matrices is singular (e.g. two identical assets), the minimum norm solutions
+    are found through the pseudo-inverses instead.
+    :param covariances: a (N, N) symmetric positive semi-definite matrix or a (K, N, N) stack of them
+    :param rhs: a (N,) vector, or a (K, N) array with one right hand side per matrix
+    :return: the solutions, with the shape of rhs
+    """
+    try:
+        lower = np.linalg.cholesky(covariances)
+        pivots = np.diagonal(lower, axis1=-2, axis2=-1) ** 2
+        is_singular = np.any(pivots.min(axis=-1) <= _SINGULAR_TOLERANCE * pivots.max(axis=-1))
+    except np.linalg.LinAlgError:
+        is_singular = True
+    if is_singular:
+        inverse = np.linalg.pinv(covariances, rcond=_SINGULAR_TOLERANCE, hermitian=True)
+        return (inverse @ rhs[..., np.newaxis])[..., 0]
+    y = np.linalg.solve(lower, rhs[..., np.newaxis])
+    return np.linalg.solve(np.swapaxes(lower, -1, -2), y)[..., 0]
+
+
+def batch_global_minimum_variance(covariances, allow_short=False):
+    """
+    Global minimum variance portfolios of a stack of covariance matrices.
+    With shorting allowed the weights are inv(Cov)*1 / 1'*inv(Cov)*1 for all the matrices at once,
+    otherwise each active set solve is warm-started from the solution of the previous matrix.
+    :param covariances: a (K, N, N) array of covariance matrices, e.g. from rolling_covariances
+    :param allow_short: if True, the weights are unbounded
+    :return: a (K, N) array of weights
+    """
+    covariances = np.asarray(covariances, dtype=float)
+    n = covariances.shape[-1]
+    if allow_short:
+        x = batch_cholesky_solve(covariances, np.ones(covariances.shape[:-1]))
+        return x / x.sum(axis=-1, keepdims=True)
+    return batch_maximize_sharpe_ratio(np.ones(n), covariances)
+
+
+def batch_maximize_sharpe_ratio(expected_returns, covariances, risk_free_rate=0, allow_short=False):
+    """
+    Maximum sharpe ratio portfolios of a stack of covariance matrices and expected returns.
+    With shorting allowed the weights are inv(Cov)*(mu - rf) normalized to sum to one for all the
+    matrices at once, otherwise each active set solve is warm-started from the solution of the previous one.
+    :param expected_returns: a (K, N) array of expected returns, or a (N,) vector shared by all matrices
+    :param covariances: a (K, N, N) array of covariance matrices
+    :param risk_free_rate: the risk free rate (default 0)
+    :param allow_short: if True, the weights are unbounded
+    :return: a (K, N) array of weights
+    """
+    covariances = np.asarray(covariances, dtype=float)
+    expected_returns = np.broadcast_to(np.asarray(expected_returns, dtype=float), covariances.shape[:-1])
+    if allow_short:
+        x = batch_cholesky_solve(covariances, expected_returns - risk_free_rate)
+        return x / x.sum(axis=-1, keepdims=True)
+    weights = np.empty(expected_returns.shape)
+    previous = None
+    for k in range(len(covariances)):
+        weights[k] = maximize_sharpe_ratio(expected_returns[k], covariances[k],
+                                           risk_free_rate=risk_free_rate,
+                                           initial_weights=previous)
+        previous = weights[k]
+    return weights
+
+
+def rolling_covariances(returns, window):
+    """
+    Sample covariance matrices of all the rolling windows of returns
+    :param returns: a (T, N) data frame or array of returns
+    :param window: the number of periods in each window
+    :return: a (T - window + 1, N, N) array, the k-th matrix is estimated on rows k to k + window - 1
+    """
+    values = np.asarray(returns, dtype=float)
+    windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+    deviations = windows - windows.mean(axis=-1, keepdims=True)
+    return np.einsum('kiw,kjw->kij', deviations, deviations) / (window - 1)
+
+
+def critical_line(expected_returns, covariance, tolerance=1e-10):
+    """
+    Markowitz's Critical Line Algorithm for the long-only (0 <= w <= 1), fully invested frontier.
+    Starting from the highest return portfolio, each turning point is derived from the previous one
+    by freeing or bounding a single asset, until the minimum variance portfolio is reached.
+    Between two turning points, the efficient weights are a linear interpolation of them.
+    The covariance is only used through solves restricted to the free assets and matrix-vector products,
+    so a FactorCovariance is never expanded to the dense matrix.
+    :param expected_returns: the vector of expected returns
+    :param covariance: the covariance matrix of the assets, or a FactorCovariance
+    :param tolerance: tolerance for purging turning points that violate the constraints
+    :return: a (turning points, assets) array of weights, by decreasing return
+    """
+    mean = np.asarray(expected_returns, dtype=float)
+    covariance = _as_covariance(covariance)
+    n = len(mean)
+    lower, upper = np.zeros(n), np.ones(n)
+    # start with the highest return assets, filled up to their upper bound
+    w = lower.copy()
+    order = np.argsort(mean)
+    i = n
+    while w.sum() < 1:
+        i -= 1
+        w[order[i]] = upper[order[i]]
+    w[order[i]] += 1 - w.sum()
+    is_free = np.zeros(n, dtype=bool)
+    is_free[order[i]] = True
+    turning_points = [w.copy()]
+    last_lambda = None
+    # the asset that changed at the previous turning point cannot change back straight away,
+    # otherwise rounding errors can make the algorithm cycle
+    last_asset = None
+    while True:
+        free, bounded = np.flatnonzero(is_free), np.flatnonzero(~is_free)
+        terms = _free_terms(covariance, mean, w, is_free)
+        # case a) one free weight moves to a bound
+        lambda_in = None
+        if len(free) > 1:
+            lambdas, bounds = _lambdas_to_bound(terms, w[bounded], lower[free], upper[free])
+            lambdas[free == last_asset] = -np.inf
+            if np.any(np.isfinite(lambdas)):
+                j = np.nanargmax(np.where(np.isfinite(lambdas), lambdas, np.nan))
+                lambda_in, asset_in, bound_in = lambdas[j], free[j], bounds[j]
+        # case b) one bounded weight becomes free
+        lambda_out = None
+        if len(bounded) > 0:
+            lambdas = _lambdas_to_free(covariance, terms, mean, w, is_free)
+            if last_lambda is not None:
+                lambdas = np.where(lambdas < last_lambda, lambdas, -np.inf)
+            lambdas[bounded == last_asset] = -np.inf
+            if np.any(np.isfinite(lambdas)):
+                j = np.argmax(lambdas)
+                lambda_out, asset_out = lambdas[j], bounded[j]
+        if (lambda_in is None or lambda_in < 0) and (lambda_out is None or lambda_out < 0):
+            # the minimum variance portfolio is the last turning point
+            last_lambda = 0
+        else:
+            if lambda_out is None or (lambda_in is not None and lambda_in > lambda_out):
+                last_lambda, last_asset = lambda_in, asset_in
+                is_free[asset_in] = False
+                w[asset_in] = bound_in
+            else:
+                last_lambda, last_asset = lambda_out, asset_out
+                is_free[asset_out] = True
+            free, bounded = np.flatnonzero(is_free), np.flatnonzero(~is_free)
+            terms = _free_terms(covariance, mean, w, is_free)
+        w[free] = _critical_line_weights(terms, w[bounded], last_lambda)
+        turning_points.append(w.copy())
+        if last_lambda == 0:
+            break
+    return _purge_turning_points(np.array(turning_points), mean, lower, upper, tolerance)
+
+
+def _free_terms(covariance, mean, w, is_free):
+    """
+    The products of the inverse covariance of the free assets with 1, the mean and Cov_fb * w_b,
+    and Cov * w_b, the product of the covariance with the bounded weights (zero for the free assets)
+    """
+    bounded_weights = np.where(is_free, 0, w)
+    covariance_w_b = covariance @ bounded_weights
+    rhs = np.column_stack([np.ones(is_free.sum()), mean[is_free], covariance_w_b[is_free]])
+    inv_ones, inv_mean, inv_covariance_w_b = _solve(covariance, rhs, is_free).T
+    return inv_ones, inv_mean, inv_covariance_w_b, covariance_w_b
+
+
+def _lambdas_to_bound(terms, w_b, lower, upper):
+    """
+    The values of lambda at which each free asset reaches one of its bounds, and the bound it reaches
+    """
+    c4, c2, l3, _ = terms
+    c1 = c4.sum()
+    c3 = c2.sum()
+    c = -c1 * c2 + c3 * c4
+    bounds = np.where(c > 0, upper, lower)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lambdas = ((1 - w_b.sum() + l3.sum()) * c4 - c1 * (bounds + l3)) / c
+    return np.where(c != 0, lambdas, -np.inf), bounds
+
+
+def _lambdas_to_free(covariance, terms, mean, w, is_free):
+    """
+    The values of lambda at which each bounded asset would become free.
+    The inverse covariance of the free assets plus one bounded asset is obtained by bordering
+    the current one, so all candidates are evaluated at once with u = inv(Cov_ff) * Cov_fb.
+    """
+    inv_ones, inv_mean, inv_covariance_w_b, covariance_w_b = terms
+    mean_b, w_b = mean[~is_free], w[~is_free]
+    # Cov_bf times the solved vectors: u'*1, u'*mean_f and u'*Cov_fb*w_b
+    solved = np.zeros((len(mean), 3))
+    solved[is_free] = np.column_stack([inv_ones, inv_mean, inv_covariance_w_b])
+    ones_u, u_mean, u_covariance_w_b = (covariance @ solved)[~is_free].T
+    ones_u = ones_u - 1
+    diagonal_b = covariance.diagonal()[~is_free]
+    # diag(Cov_bf * inv(Cov_ff) * Cov_fb)
+    quadratic = _bordered_quadratic_forms(covariance, is_free)
+    schur = diagonal_b - quadratic
+    # the terms of the bordered system, for each candidate
+    c1 = inv_ones.sum() + ones_u ** 2 / schur
+    c2 = (mean_b - u_mean) / schur
+    c3 = inv_mean.sum() + (u_mean - mean_b) * ones_u / schur
+    c4 = -ones_u / schur
+    c = -c1 * c2 + c3 * c4
+    # y_f = Cov_fb * w_b without the candidate, y_b = Cov_bb * w_b without its diagonal
+    ones_inv_y_f = inv_ones @ covariance_w_b[is_free] - (ones_u + 1) * w_b
+    y_b = covariance_w_b[~is_free] - diagonal_b * w_b
+    u_y = u_covariance_w_b - quadratic * w_b
+    l1 = w_b.sum() - w_b
+    l2 = ones_inv_y_f + (u_y - y_b) * ones_u / schur
+    l3 = (y_b - u_y) / schur
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lambdas = ((1 - l1 + l2) * c4 - c1 * (w_b + l3)) / c
+    return np.where((c != 0) & np.isfinite(lambdas), lambdas, -np.inf)
+
+
+def _bordered_quadratic_forms(covariance, is_free):
+    """
+    The quadratic forms Cov_jf * inv(Cov_ff) * Cov_fj of each bounded asset j.
+    For a factor covariance Cov_fb = B_f*F*B_b', so only K systems of the free assets are solved.
+    """
+    if isinstance(covariance, FactorCovariance):
+        loadings_f = covariance.loadings[is_free] @ covariance.factor_covariance
+        projected = loadings_f.T @ covariance.subset(is_free).solve(loadings_f)
+        return np.einsum('jk,kl,jl->j', covariance.loadings[~is_free], projected, covariance.loadings[~is_free])
+    covariance_fb = covariance[np.ix_(is_free, ~is_free)]
+    return np.sum(covariance_fb * _solve(covariance, covariance_fb, is_free), axis=0)
+
+
+def _critical_line_weights(terms, w_b, lam):
+    """
+    The weights of the free assets on the critical line, for a given lambda
+    """
+    inv_ones, inv_mean, w1, _ = terms
+    g1 = inv_mean.sum()
+    g2 = inv_ones.sum()
+    gamma = -lam * g1 / g2 + (1 - w_b.sum() + w1.sum()) / g2
+    return -w1 + gamma * inv_ones + lam * inv_mean
+
+
+def _purge_turning_points(turning_points, mean, lower, upper, tolerance):
+    """
+    Remove turning points that violate the constraints because of an ill-conditioned covariance,
+    and those that are not on the efficient side of the frontier
+    """
+    feasible = (np.abs(turning_points.sum(axis=1) - 1) <= tolerance) \
+        & np.all(turning_points - lower >= -tolerance, axis=1) \
+        & np.all(turning_points - upper <= tolerance, axis=1)
+    turning_points = turning_points[feasible]
+    returns = turning_points @ mean
+    keep = [0]
+    for k in range(1, len(turning_points)):
+        if returns[k] <= returns[keep[-1]]:
+            keep.append(k)
+    return turning_points[keep]
+
+
+class EfficientFrontier:
+    """
+    Points on the minimum variance frontier
+    """
+
+    def __init__(self, weights, returns, volatilities):
+        self.weights = weights
+        self.returns = returns
+        self.volatilities = volatilities
+
+    def __len__(self):
+        return len(self.returns)
+
+    def as_data_frame(self):
+        return pd.DataFrame({
+            "Returns": self.returns,
+            "Volatility": self.volatilities
+        })
+
+
+def efficient_frontier(expected_returns, covariance, n_points=20, target_returns=None):
+    """
+    Trace the long-only minimum variance frontier in one pass with the critical line algorithm.
+    The weights at each target return are interpolated between the turning points,
+    which gives the same portfolios as minimize_volatility for every target.
+    :param expected_returns: the vector of expected returns
+    :param covariance: the covariance matrix of the assets, or a FactorCovariance
+    :param n_points: number of equally spaced target returns, from the lowest to the highest asset return
+    :param target_returns: explicit target returns, overrides n_points
+    :rtype: EfficientFrontier
+    :return: the weights, returns and volatilities of the frontier portfolios
+    """
+    mean = np.asarray(expected_returns, dtype=float)
+    covariance = _as_covariance(covariance)
+    if target_returns is None:
+        target_returns = np.linspace(mean.min(), mean.max(), n_points)
+    target_returns = np.asarray(target_returns, dtype=float)
+    # the efficient branch, down to the minimum variance portfolio, followed by
+    # the inefficient branch, which is the efficient frontier of the negated returns
+    upper_branch = critical_line(mean, covariance)
+    lower_branch = critical_line(-mean, covariance)
+    turning_points = np.vstack([upper_branch, lower_branch[::-1]])
+    # interpolate by increasing return
+    turning_points = turning_points[::-1]
+    turning_returns = turning_points @ mean
+    segment = np.clip(np.searchsorted(turning_returns, target_returns, side='right') - 1,
+                      0, len(turning_returns) - 2)
+    start, end = turning_returns[segment], turning_returns[segment + 1]
+    width = np.where(end > start, end - start, 1)
+    fraction = np.clip((target_returns - start) / width, 0, 1).reshape(-1, 1)
+    weights = (1 - fraction) * turning_points[segment] + fraction * turning_points[segment + 1]
+    returns = weights @ mean
+    volatilities = np.sqrt(np.einsum('ij,ji->i', weights, covariance @ weights.T))
+    return EfficientFrontier(weights, returns, volatilities)
 
 
 class Portfolio:
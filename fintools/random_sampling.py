@@ -0,0 +1,53 @@
+import numpy as np
+from scipy.stats import norm, qmc
+
+
+def make_generator(seed=None):
+    """
+    Create a random generator
+    :param seed: None, an int seed, a SeedSequence or an existing Generator (returned as is)
+    :return: a numpy.random.Generator
+    """
+    return np.random.default_rng(seed)
+
+
+def spawn_generators(seed, n):
+    """
+    Create independent random streams, e.g. one for each parallel worker
+    :param seed: None, an int seed, a SeedSequence or an existing Generator
+    :param n: the number of streams
+    :return: a list of n statistically independent Generators
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed.spawn(n)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [np.random.default_rng(child) for child in seed.spawn(n)]
+
+
+def standard_normal(n_steps, scenarios, seed=None, antithetic=False, sobol=False, dtype=np.float64):
+    """
+    Draw standard normal shocks for a set of sample paths
+    :param n_steps: number of time steps (rows)
+    :param scenarios: number of sample paths (columns)
+    :param seed: seed or Generator of the random numbers
+    :param antithetic: if True, the second half of the paths mirrors the first half (Z, -Z)
+    :param sobol: if True, use a scrambled Sobol sequence (one dimension per step) instead of pseudo-random numbers
+    :param dtype: float64 or float32
+    :return: a (n_steps, scenarios) array of standard normal shocks
+    """
+    generator = make_generator(seed)
+    n_draws = (scenarios + 1) // 2 if antithetic else scenarios
+    if sobol:
+        sampler = qmc.Sobol(d=n_steps, scramble=True, seed=generator)
+        # Sobol points lie on a 2^-30 grid, keep them away from 0 and 1
+        uniforms = np.clip(sampler.random(n_draws), 2 ** -31, 1 - 2 ** -31)
+        draws = np.ascontiguousarray(norm.ppf(uniforms).T, dtype=dtype)
+    else:
+        draws = generator.standard_normal(size=(n_steps, n_draws), dtype=dtype)
+    if not antithetic:
+        return draws
+    shocks = np.empty((n_steps, scenarios), dtype=dtype)
+    shocks[:, :n_draws] = draws
+    np.negative(draws[:, :scenarios - n_draws], out=shocks[:, n_draws:])
+    return shocks
@@ -0,0 +1,223 @@
+import numpy as np
+import pandas as pd
+from scipy.integrate import quad
+from scipy.signal import lfilter
+
+from fintools.random_sampling import make_generator, spawn_generators
+
+
+class ShortRateModel:
+    """
+    Interface for short rate models.
+    Rates are instantaneous (continuously compounded) annual rates.
+    """
+
+    def simulate_rates(self, n_steps, dt, n_scenarios, generator):
+        """
+        Sample paths of the short rate exactly at the grid times 0, dt, ..., n_steps*dt
+        :return: a (n_steps + 1, n_scenarios) array of rates
+        """
+        pass
+
+    def zero_coupon_prices(self, rates, times, maturity):
+        """
+        Closed form price of a zero coupon bond paying 1 at the maturity
+        :param rates: a (len(times), n_scenarios) array of short rates
+        :param times: the times (in years) of the rows of rates
+        :param maturity: the maturity of the bond (in years)
+        :return: an array of bond prices shaped like rates
+        """
+        pass
+
+
+def _gaussian_mean_reversion(a, sigma, start, n_steps, dt, n_scenarios, generator):
+    """
+    Exact sampling of the Ornstein-Uhlenbeck process dx = -a*x*dt + sigma*dW, x(0) = start.
+    The AR(1) recursion x' = exp(-a*dt)*x + noise is run over all the scenarios by a linear filter.
+    """
+    decay = np.exp(-a * dt)
+    scale = sigma * np.sqrt(-np.expm1(-2 * a * dt) / (2 * a))
+    noise = scale * generator.standard_normal(size=(n_steps, n_scenarios))
+    paths = np.empty((n_steps + 1, n_scenarios))
+    paths[0] = start
+    initial_state = np.full((1, n_scenarios), decay * start)
+    paths[1:], _ = lfilter([1], [1, -decay], noise, axis=0, zi=initial_state)
+    return paths
+
+
+def _b_factor(a, tau):
+    return -np.expm1(-a * tau) / a
+
+
+class VasicekModel(ShortRateModel):
+    """
+    Vasicek model: dr = a*(b - r)*dt + sigma*dW
+    """
+
+    def __init__(self, a, b, sigma, initial_rate=None):
+        self.a = a
+        self.b = b
+        self.sigma = sigma
+        self.initial_rate = b if initial_rate is None else initial_rate
+
+    def simulate_rates(self, n_steps, dt, n_scenarios, generator):
+        deviation = _gaussian_mean_reversion(self.a, self.sigma, self.initial_rate - self.b,
+                                             n_steps, dt, n_scenarios, generator)
+        return deviation + self.b
+
+    def zero_coupon_prices(self, rates, times, maturity):
+        a, b, sigma = self.a, self.b, self.sigma
+        tau = (maturity - np.asarray(times, dtype=float)).reshape(-1, 1)
+        b_factor = _b_factor(a, tau)
+        log_a = (b_factor - tau) * (a ** 2 * b - sigma ** 2 / 2) / a ** 2 - sigma ** 2 * b_factor ** 2 / (4 * a)
+        return _expire(np.exp(log_a - b_factor * rates), tau)
+
+
+class CirModel(ShortRateModel):
+    """
+    Cox-Ingersoll-Ross model: dr = a*(b - r)*dt + sigma*sqrt(r)*dW
+    Transitions are sampled exactly from the scaled non-central chi-square distribution.
+    """
+
+    def __init__(self, a, b, sigma, initial_rate=None):
+        self.a = a
+        self.b = b
+        self.sigma = sigma
+        self.initial_rate = b if initial_rate is None else initial_rate
+
+    def simulate_rates(self, n_steps, dt, n_scenarios, generator):
+        a, b, sigma = self.a, self.b, self.sigma
+        scale = -sigma ** 2 * np.expm1(-a * dt) / (4 * a)
+        degrees_of_freedom = 4 * a * b / sigma ** 2
+        decay = np.exp(-a * dt) / scale
+        rates = np.empty((n_steps + 1, n_scenarios))
+        rates[0] = self.initial_rate
+        for step in range(1, n_steps + 1):
+            rates[step] = scale * generator.noncentral_chisquare(degrees_of_freedom, decay * rates[step - 1])
+        return rates
+
+    def zero_coupon_prices(self, rates, times, maturity):
+        a, b, sigma = self.a, self.b, self.sigma
+        tau = (maturity - np.asarray(times, dtype=float)).reshape(-1, 1)
+        h = np.sqrt(a ** 2 + 2 * sigma ** 2)
+        growth = np.expm1(h * tau)
+        denominator = 2 * h + (a + h) * growth
+        a_factor = (2 * h * np.exp((a + h) * tau / 2) / denominator) ** (2 * a * b / sigma ** 2)
+        b_factor = 2 * growth / denominator
+        return _expire(a_factor * np.exp(-b_factor * rates), tau)
+
+
+class HullWhiteModel(ShortRateModel):
+    """
+    Hull-White (extended Vasicek) model: dr = (theta(t) - a*r)*dt + sigma*dW
+    with theta fitted to the initial term structure of instantaneous forward rates.
+    """
+
+    def __init__(self, a, sigma, forward_rate):
+        """
+        :param a: mean reverting rate
+        :param sigma: volatility
+        :param forward_rate: a flat forward rate, or a function of t returning the forward rate f(0, t)
+        """
+        self.a = a
+        self.sigma = sigma
+        self.forward_rate = forward_rate
+
+    def _forward(self, times):
+        if callable(self.forward_rate):
+            return np.vectorize(self.forward_rate, otypes=[float])(times)
+        return np.full(np.shape(times), self.forward_rate, dtype=float)
+
+    def _initial_discount(self, times):
+        if callable(self.forward_rate):
+            integral = np.vectorize(lambda t: quad(self.forward_rate, 0, t)[0], otypes=[float])
+            return np.exp(-integral(times))
+        return np.exp(-self.forward_rate * np.asarray(times, dtype=float))
+
+    def _alpha(self, times):
+        return self._forward(times) + (self.sigma * _b_factor(self.a, times)) ** 2 / 2
+
+    def simulate_rates(self, n_steps, dt, n_scenarios, generator):
+        times = dt * np.arange(n_steps + 1)
+        deviation = _gaussian_mean_reversion(self.a, self.sigma, 0.0, n_steps, dt, n_scenarios, generator)
+        return deviation + self._alpha(times).reshape(-1, 1)
+
+    def zero_coupon_prices(self, rates, times, maturity):
+        a, sigma = self.a, self.sigma
+        times = np.asarray(times, dtype=float)
+        tau = (maturity - times).reshape(-1, 1)
+        b_factor = _b_factor(a, tau)
+        ratio = (self._initial_discount(maturity) / self._initial_discount(times)).reshape(-1, 1)
+        forward = self._forward(times).reshape(-1, 1)
+        variance = sigma ** 2 * -np.expm1(-2 * a * times).reshape(-1, 1) / (4 * a)
+        return _expire(ratio * np.exp(b_factor * forward - variance * b_factor ** 2 - b_factor * rates), tau)
+
+
+def _expire(prices, tau):
+    """
+    Bonds that have already matured have no price
+    """
+    return np.where(tau >= 0, prices, np.nan)
+
+
+def iter_short_rates(model: ShortRateModel,
+                     n_years: int = 10,
+                     n_scenarios: int = 1,
+                     steps_per_year: int = 12,
+                     maturity: float = None,
+                     chunk_size: int = 10000,
+                     seed=None):
+    """
+    Simulate a short rate model in chunks of scenarios, so that large simulations
+    never hold more than chunk_size paths in memory.
+    Each chunk has its own random stream spawned from the seed.
+    :param model: the short rate model
+    :param n_years: number of years to simulate
+    :param n_scenarios: total number of scenarios
+    :param steps_per_year: time steps per year
+    :param maturity: maturity (in years) of the zero coupon bond priced along the paths. Default is n_years
+    :param chunk_size: scenarios per chunk
+    :param seed: seed or numpy.random.Generator
+    :return: a generator of dictionaries of (steps + 1, chunk) arrays: rates and zero_coupon_prices
+    """
+    if maturity is None:
+        maturity = n_years
+    dt = 1 / steps_per_year
+    n_steps = int(n_years * steps_per_year)
+    times = dt * np.arange(n_steps + 1)
+    chunk_sizes = [min(chunk_size, n_scenarios - start) for start in range(0, n_scenarios, chunk_size)]
+    for size, generator in zip(chunk_sizes, spawn_generators(seed, len(chunk_sizes))):
+        rates = model.simulate_rates(n_steps, dt, size, generator)
+        yield {
+            "rates": rates,
+            "zero_coupon_prices": model.zero_coupon_prices(rates, times, maturity)
+        }
+
+
+def simulate_short_rates(model: ShortRateModel,
+                         n_years: int = 10,
+                         n_scenarios: int = 1,
+                         steps_per_year: int = 12,
+                         maturity: float = None,
+                         seed=None):
+    """
+    Simulate a short rate model exactly and price a zero coupon bond along every path in closed form
+    :param model: the short rate model
+    :param n_years: number of years to simulate
+    :param n_scenarios: number of scenarios
+    :param steps_per_year: time steps per year
+    :param maturity: maturity (in years) of the zero coupon bond. Default is n_years
+    :param seed: seed or numpy.random.Generator
+    :return: a dictionary with data frames of (instantaneous) rates and zero coupon prices
+    """
+    if maturity is None:
+        maturity = n_years
+    dt = 1 / steps_per_year
+    n_steps = int(n_years * steps_per_year)
+    times = dt * np.arange(n_steps + 1)
+    rates = model.simulate_rates(n_steps, dt, n_scenarios, make_generator(seed))
+    prices = model.zero_coupon_prices(rates, times, maturity)
+    return {
+        "rates": pd.DataFrame(rates, index=range(n_steps + 1)),
+        "zero_coupon_prices": pd.DataFrame(prices, index=range(n_steps + 1))
+    }
@@ -1,10 +1,8 @@
 from abc import ABC, abstractmethod
 
+import numpy as np
 import pandas as pd
 
-from fintools.calculator import *
-from fintools.portfolio import compute_portfolio_return
-
 
 class InvestmentStrategy(ABC):
 
@@ -19,23 +17,74 @@ class InvestmentStrategy(ABC):
         """
         pass
 
+    def update_scenario_weights(self, current_weights, account_values, returns):
+        """
+        Update the portfolio weights of many scenarios at once.
+        By default each scenario is updated in turn by update_portfolio_weighs:
+        strategies that can work on all the scenarios together should override it.
+        :param current_weights: (scenarios, assets) array of current portfolio weights
+        :param account_values: vector of the current account balance of each scenario
+        :param returns: (scenarios, assets) array of last period returns
+        :return: the (scenarios, assets) array of adjusted portfolio weights
+        """
+        return np.array([self.update_portfolio_weighs(weights, account_value, scenario_returns)
+                         for weights, account_value, scenario_returns
+                         in zip(current_weights, account_values, returns)], dtype=float)
+
 
 class NoRebalanceInvestmentStrategy(InvestmentStrategy):
 
     def update_portfolio_weighs(self, current_weights, account_value, returns):
-        denominator = current_weights @ (1 + returns)
-        return np.multiply(current_weights, (1 + returns)) / denominator
+        return self.update_scenario_weights(current_weights, account_value, returns)
+
+    def update_scenario_weights(self, current_weights, account_values, returns):
+        # the weights drift with the value of each position
+        positions = np.multiply(current_weights, 1 + np.asarray(returns, dtype=float))
+        return positions / positions.sum(axis=-1, keepdims=True)
 
 
 class Stats:
+    """
+    Account values and portfolio returns of a simulation, one column per scenario.
+    The histories are kept as arrays and converted to Data Frames when they are first requested:
+    a Series for the simulation of a single history of returns, otherwise a Data Frame with one column per scenario.
+    """
 
-    def __init__(self, returns):
-        self.account_history = pd.DataFrame().reindex_like(returns)
-        self.return_history = pd.DataFrame().reindex_like(returns)
+    def __init__(self, account_values, portfolio_returns, index=None, single=False):
+        """
+        :param account_values: (steps, scenarios) array of the account value at the end of each step
+        :param portfolio_returns: (steps, scenarios) array of the portfolio return of each step
+        :param index: the index of the steps
+        :param single: True if the simulation had a single scenario
+        """
+        self.account_values = account_values
+        self.portfolio_returns = portfolio_returns
+        self.index = index
+        self.single = single
+        self.__histories = {}
 
-    def update(self, step, preturn, account_value):
-        self.account_history.iloc[step] = account_value
-        self.return_history.iloc[step] = preturn
+    def __len__(self):
+        return self.account_values.shape[1]
+
+    def __history(self, name, values):
+        if name not in self.__histories:
+            if self.single:
+                self.__histories[name] = pd.Series(values[:, 0], index=self.index)
+            else:
+                self.__histories[name] = pd.DataFrame(values, index=self.index, copy=False)
+        return self.__histories[name]
+
+    @property
+    def account_history(self):
+        return self.__history('account', self.account_values)
+
+    @property
+    def return_history(self):
+        return self.__history('return', self.portfolio_returns)
+
+    @property
+    def terminal_values(self):
+        return self.account_values[-1]
 
 
 class StrategySimulator:
@@ -47,20 +96,43 @@ class StrategySimulator:
                  returns,
                  initial_portfolio_weights,
                  initial_balance):
-        dates = returns.index
-        steps = len(dates)
-        portfolio_weights = initial_portfolio_weights
-        account_value = initial_balance
-        stats = Stats(returns)
+        """
+        Simulate an investment strategy over one or many scenarios of returns
+        A single Data Frame of returns is simulated as before: the strategy's update_portfolio_weighs receives
+        the account value and the returns of each step as a Series labelled by asset.
+        Arrays of scenarios go through update_scenario_weights, with plain arrays.
+        :param returns: Data Frame of the returns of the assets, or a (steps, scenarios, assets) array of returns,
+            e.g. from BootstrapScenarios.panel() or correlated_gbm(..., prices=False)
+        :param initial_portfolio_weights: the initial weights shared by all the scenarios,
+            or a (scenarios, assets) array of initial weights
+        :param initial_balance: the initial account value
+        :rtype: Stats
+        :return: the account values and portfolio returns of each scenario
+        """
+        single = np.ndim(returns) == 2
+        index = returns.index if isinstance(returns, pd.DataFrame) else None
+        values = np.asarray(returns, dtype=float)
+        if single:
+            values = values[:, np.newaxis, :]
+        steps, n_scenarios, n_assets = values.shape
+        weights = np.broadcast_to(np.asarray(initial_portfolio_weights, dtype=float), (n_scenarios, n_assets))
+        if self.__investment_strategy is None:
+            # the weights never change: every step of every scenario is one matrix product
+            portfolio_returns = np.einsum('tsa,sa->ts', values, weights)
+            account_history = initial_balance * np.cumprod(1 + portfolio_returns, axis=0)
+            return Stats(account_history, portfolio_returns, index=index, single=single)
+        portfolio_returns = np.empty((steps, n_scenarios))
+        account_history = np.empty((steps, n_scenarios))
+        account_values = np.full(n_scenarios, float(initial_balance))
         for step in range(steps):
-            asset_returns = returns.iloc[step]
-            portfolio_return = compute_portfolio_return(returns=asset_returns, weights=portfolio_weights)
-            account_value = (1 + portfolio_return) * account_value
-            # update stats
-            stats.update(step, portfolio_return, account_value)
-            # update weights
-            if self.__investment_strategy:
-                portfolio_weights = self.__investment_strategy \
-                    .update_portfolio_weighs(portfolio_weights, account_value, asset_returns)
-
-        return stats
+            np.einsum('ij,ij->i', weights, values[step], out=portfolio_returns[step])
+            account_values *= 1 + portfolio_returns[step]
+            account_history[step] = account_values
+            if isinstance(returns, pd.DataFrame):
+                step_weights = self.__investment_strategy \
+                    .update_portfolio_weighs(weights[0], account_values[0], returns.iloc[step])
+                weights = np.asarray(step_weights, dtype=float).reshape(1, n_assets)
+            else:
+                weights = self.__investment_strategy \
+                    .update_scenario_weights(weights, account_values, values[step])
+        return Stats(account_history, portfolio_returns, index=index, single=single)
@@ -1,6 +1,10 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
-from scipy.optimize import minimize
+
+from fintools.portfolio import batch_cholesky_solve
 
 
 def tracking_error(r_a, r_b):
@@ -18,24 +22,128 @@ def portfolio_tracking_error(weights, ref_r, bb_r):
     return tracking_error(ref_r, (weights * bb_r).sum(axis=1))
 
 
+def portfolio_tracking_error_gradient(weights, ref_r, bb_r):
+    """
+    returns the gradient of the portfolio tracking error with respect to the weights
+    """
+    residuals = ref_r - (weights * bb_r).sum(axis=1)
+    error = np.sqrt((residuals ** 2).sum())
+    return -np.asarray((bb_r.mul(residuals, axis=0) if isinstance(bb_r, pd.DataFrame)
+                        else bb_r * residuals[:, None]).sum(axis=0), dtype=float) / error
+
+
+def _simplex_least_squares(quadratic, linear, initial_weights=None, tolerance=1e-10, max_iterations=None):
+    """
+    Primal active set solver of min 1/2*w'*Q*w - c'*w subject to sum(w) = 1 and w >= 0,
+    which is the least squares fit of y on X over the simplex with Q = X'X and c = X'y.
+    Collinear regressors (a singular Q) share their weight through the minimum norm solution.
+    :param quadratic: the matrix Q
+    :param linear: the vector c
+    :param initial_weights: optional feasible starting weights, e.g. the solution of the previous window
+    :return: the optimal weights
+    """
+    n = len(linear)
+    w = np.repeat(1 / n, n) if initial_weights is None else np.array(initial_weights, dtype=float)
+    free = w > 0
+    threshold = tolerance * np.abs(np.diag(quadratic)).max()
+    for _ in range(max_iterations or 10 * n):
+        # stationary point of the free weights with the others at zero
+        solved = batch_cholesky_solve(quadratic[np.ix_(free, free)], np.stack([linear[free], np.ones(free.sum())])).T
+        multiplier = (solved[:, 0].sum() - 1) / solved[:, 1].sum()
+        target = np.zeros(n)
+        target[free] = solved[:, 0] - multiplier * solved[:, 1]
+        blocking = free & (target < 0)
+        if not blocking.any():
+            w = target
+            # multipliers of the w >= 0 constraints
+            bound_multipliers = quadratic @ w - linear + multiplier
+            bound_multipliers[free] = 0
+            release = np.argmin(bound_multipliers)
+            if bound_multipliers[release] >= -threshold:
+                break
+            free[release] = True
+        else:
+            # move towards the target until the first weight hits zero
+            steps = w[blocking] / (w[blocking] - target[blocking])
+            w += steps.min() * (target - w)
+            bounded = np.flatnonzero(blocking)[np.argmin(steps)]
+            w[bounded] = 0
+            free[bounded] = False
+    w = np.maximum(w, 0)
+    return w / w.sum()
+
+
 def style_analysis(dependent_variable, explanatory_variables):
     """
     Returns the optimal weights that minimizes the Tracking error between
-    a portfolio of the explanatory variables and the dependent variable
-    """
-    n = explanatory_variables.shape[1]
-    init_guess = np.repeat(1 / n, n)
-    bounds = ((0.0, 1.0),) * n  # an N-tuple of 2-tuples!
-    # construct the constraints
-    weights_sum_to_1 = {'type': 'eq',
-                        'fun': lambda weights: np.sum(weights) - 1
-                        }
-    solution = minimize(portfolio_tracking_error, init_guess,
-                        # squeeze converts to series
-                        args=(dependent_variable.squeeze(), explanatory_variables,),
-                        method='SLSQP',
-                        options={'disp': False},
-                        constraints=(weights_sum_to_1,),
-                        bounds=bounds)
-    weights = pd.Series(solution.x, index=explanatory_variables.columns)
+    a portfolio of the explanatory variables and the dependent variable.
+    The weights are the least squares fit of the dependent variable over the simplex.
+    Periods with a missing return are dropped, as in rolling_style_analysis.
+    """
+    aligned = pd.concat([dependent_variable.squeeze().rename('__dependent__'), explanatory_variables],
+                        axis=1, join='inner').dropna()
+    y = aligned['__dependent__'].to_numpy(dtype=float)
+    x = aligned[explanatory_variables.columns].to_numpy(dtype=float)
+    weights = _simplex_least_squares(x.T @ x, x.T @ y)
+    return pd.Series(weights, index=explanatory_variables.columns)
+
+
+def _rolling_simplex_least_squares(y, x, window, first_end, last_end):
+    """
+    Fit the windows ending at positions first_end, ..., last_end - 1.
+    The cross products X'X and X'y slide with the window, and each fit starts from the previous solution.
+    """
+    start = first_end - window + 1
+    quadratic = x[start:first_end + 1].T @ x[start:first_end + 1]
+    linear = x[start:first_end + 1].T @ y[start:first_end + 1]
+    weights = np.empty((last_end - first_end, x.shape[1]))
+    previous = None
+    for end in range(first_end, last_end):
+        if end > first_end:
+            leaving, entering = end - window, end
+            if (end - first_end) % window == 0:
+                # recompute from scratch once per window length, to stop rounding errors from accumulating
+                quadratic = x[leaving + 1:end + 1].T @ x[leaving + 1:end + 1]
+                linear = x[leaving + 1:end + 1].T @ y[leaving + 1:end + 1]
+            else:
+                quadratic += np.outer(x[entering], x[entering]) - np.outer(x[leaving], x[leaving])
+                linear += x[entering] * y[entering] - x[leaving] * y[leaving]
+        previous = _simplex_least_squares(quadratic, linear, previous)
+        weights[end - first_end] = previous
     return weights
+
+
+def _fit_style_block(task):
+    return _rolling_simplex_least_squares(*task)
+
+
+def rolling_style_analysis(dependent_variable, explanatory_variables, window=36, executor='serial', n_workers=None):
+    """
+    Returns-based style analysis over rolling windows, to follow the style drift of a portfolio
+    :param dependent_variable: the returns of the portfolio
+    :param explanatory_variables: Data Frame of the returns of the style indices
+    :param window: number of periods of each window
+    :param executor: 'serial', 'threads' or 'processes'. The parallel executors split the windows in blocks,
+    and each block warm starts its windows from the previous solution
+    :param n_workers: number of threads or processes. Default is the number of CPUs
+    :return: a Data Frame of the style weights, indexed by the last period of each window
+    """
+    aligned = pd.concat([dependent_variable.squeeze().rename('__dependent__'), explanatory_variables],
+                        axis=1, join='inner').dropna()
+    y = aligned['__dependent__'].to_numpy(dtype=float)
+    x = aligned[explanatory_variables.columns].to_numpy(dtype=float)
+    n_windows = max(len(y) - window + 1, 0)
+    if n_windows == 0:
+        weights = np.empty((0, x.shape[1]))
+    elif executor == 'serial':
+        weights = _rolling_simplex_least_squares(y, x, window, window - 1, len(y))
+    elif executor in ('threads', 'processes'):
+        n_workers = n_workers or os.cpu_count()
+        blocks = [block for block in np.array_split(np.arange(n_windows), n_workers) if len(block) > 0]
+        tasks = [(y, x, window, window - 1 + block[0], window + block[-1]) for block in blocks]
+        pool_class = ThreadPoolExecutor if executor == 'threads' else ProcessPoolExecutor
+        with pool_class(max_workers=n_workers) as pool:
+            weights = np.concatenate(list(pool.map(_fit_style_block, tasks)))
+    else:
+        raise ValueError(f"Unknown executor: {executor}")
+    return pd.DataFrame(weights, index=aligned.index[window - 1:], columns=explanatory_variables.columns)
@@ -21,14 +21,7 @@ def plot_efficiency_frontier(expected_return, covariance,
     :param show_ew : Show equally weighted portfolio
     :param show_gmv: Show the global minimum volatility portfolio
     """
-    target_returns = np.linspace(expected_return.min(), expected_return.max(), n_points)
-    weights = [minimize_volatility(tr, expected_return, covariance) for tr in target_returns]
-    rets = [compute_portfolio_return(w, expected_return) for w in weights]
-    vols = [compute_portfolio_variance(w, covariance) for w in weights]
-    ef = pd.DataFrame({
-        "Returns": rets,
-        "Volatility": vols
-    })
+    ef = efficient_frontier(expected_return, covariance, n_points=n_points).as_data_frame()
     ax = ef.plot.line(x="Volatility", y="Returns", style=style, legend=legend)
     if show_cml:
         ax.set_xlim(left=0)
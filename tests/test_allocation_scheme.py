@@ -34,3 +34,46 @@ def test_cap_weighted():
     assert allocation.index[2] == 'Servs'
 
 
+def test_rolling_window():
+    returns = load_industry_returns('ind30_m_vw_rets.csv')['2000':'2010']
+    window = RollingWindow(returns, 24)
+    assert window.returns.equals(returns.iloc[0:24])
+    window.covariance()
+    while window.has_next():
+        window.advance()
+        assert np.allclose(returns.iloc[window.start:window.end].cov(), window.covariance())
+        assert np.allclose(returns.iloc[window.start:window.end].mean(), window.mean())
+    assert len(returns) == window.end
+
+
+def test_global_minimum_variance_scheme():
+    returns = load_industry_returns('ind30_m_vw_rets.csv')['2000':'2005'][['Food', 'Beer', 'Smoke', 'Games', 'Fin']]
+    scheme = GlobalMinimumVarianceAllocationScheme()
+    window = RollingWindow(returns, 36)
+    window.advance()
+    allocation = scheme.get_window_allocation(window)
+    assert 1 == pytest.approx(allocation.sum())
+    assert np.allclose(scheme.get_allocation(returns.iloc[1:37]), allocation, atol=1e-6)
+
+
+def test_window_allocation_fallback():
+    class FirstAssetAllocationScheme(AllocationScheme):
+        def get_allocation(self, returns):
+            return pd.Series([1.0] + [0.0] * (returns.shape[1] - 1), index=returns.columns)
+
+    returns = load_industry_returns('ind30_m_vw_rets.csv')['2000':'2005']
+    backtest = backtest_allocation(returns, estimation_window=12, allocation_scheme=FirstAssetAllocationScheme())
+    assert np.allclose(returns['Food'].iloc[12:], backtest.dropna())
+
+
+@pytest.mark.parametrize("estimator", [LedoitWolfCovarianceEstimator(), EwmaCovarianceEstimator()])
+def test_window_covariance_estimator(estimator):
+    returns = load_industry_returns('ind30_m_vw_rets.csv')['2000':'2005'][['Food', 'Beer', 'Smoke', 'Games', 'Fin']]
+    scheme = GlobalMinimumVarianceAllocationScheme(estimator)
+    window = RollingWindow(returns, 24)
+    for start in range(30):
+        if start > 0:
+            window.advance()
+        allocation = scheme.get_window_allocation(window)
+        expected = scheme.get_allocation(returns.iloc[start:start + 24])
+        assert np.allclose(expected, allocation)
@@ -1,4 +1,7 @@
+import pytest
+
 from fintools import *
+from fintools.asset_model import _cached_covariance_factor, _covariance_factor
 
 # TODO: come up with better tests
 
@@ -12,3 +15,109 @@ def test_asset_model_returns():
     returns = geometric_brownian_motion(mu=0.2, sigma=0.1, years=11, scenarios=2000, prices=False)
     assert (132, 2000) == returns.shape
     assert (132, 1) == returns[[1000]].shape
+
+
+def test_asset_model_seed():
+    prices = geometric_brownian_motion(mu=0.07, sigma=0.15, years=5, scenarios=100, seed=11)
+    same = geometric_brownian_motion(mu=0.07, sigma=0.15, years=5, scenarios=100, seed=11)
+    assert prices.equals(same)
+
+
+def test_asset_model_antithetic():
+    returns = geometric_brownian_motion(mu=0.1, sigma=0.2, years=1, scenarios=10, prices=False,
+                                        seed=3, antithetic=True)
+    # the mirrored shocks average out to the drift exactly
+    mean_returns = returns.iloc[1:].mean(axis=1)
+    assert np.allclose(0.1 / 12, mean_returns)
+
+
+def test_asset_model_float32_array():
+    prices = geometric_brownian_motion(mu=0.07, sigma=0.15, years=5, scenarios=100, seed=11,
+                                       dtype=np.float32, output='array')
+    assert isinstance(prices, np.ndarray)
+    assert np.float32 == prices.dtype
+    assert (60, 100) == prices.shape
+    assert np.all(prices[0] == 1)
+    assert np.all(prices > 0)
+
+
+def test_asset_model_readonly():
+    returns = geometric_brownian_motion(mu=0.07, sigma=0.15, years=5, scenarios=10, prices=False,
+                                        output='readonly')
+    assert (60, 10) == returns.shape
+    assert not returns.flags.writeable
+    with pytest.raises(ValueError):
+        returns[0, 0] = 1
+
+
+def test_asset_model_exact():
+    prices = geometric_brownian_motion(mu=0.07, sigma=0.2, years=10, scenarios=50000, seed=5,
+                                       exact=True, output='array')
+    assert np.all(prices > 0)
+    # E[S_t] = S_0 * exp(mu * t), with 119 steps after the fixed first row
+    assert np.exp(0.07 * 119 / 12) == pytest.approx(prices[-1].mean(), 0.01)
+
+
+def test_gbm_terminal_prices():
+    prices = gbm_terminal_prices(mu=0.07, sigma=0.2, years=10, scenarios=100000, initial_price=100,
+                                 seed=1, antithetic=True)
+    assert (100000,) == prices.shape
+    assert 100 * np.exp(0.7) == pytest.approx(prices.mean(), 0.01)
+
+
+def test_gbm_path_statistics():
+    stats = gbm_path_statistics(mu=0.07, sigma=0.2, years=2, scenarios=5, seed=3, block_steps=7)
+    # the same shocks, generated as a full path matrix
+    shocks = standard_normal(24, 5, seed=3)
+    log_prices = np.cumsum((0.07 - 0.02) / 12 + 0.2 * np.sqrt(1 / 12) * shocks, axis=0)
+    prices = np.exp(np.vstack([np.zeros(5), log_prices]))
+    assert 5 == len(stats)
+    assert np.allclose(prices[-1], stats.terminal)
+    assert np.allclose(prices.max(axis=0), stats.maximum)
+    assert np.allclose(prices.min(axis=0), stats.minimum)
+    drawdowns = prices / np.maximum.accumulate(prices, axis=0) - 1
+    assert np.allclose(drawdowns.min(axis=0), stats.max_drawdown)
+    assert (5, 4) == stats.as_data_frame().shape
+
+
+def test_correlated_gbm():
+    returns = load_industry_returns()['2000':][['Food', 'Beer', 'Smoke', 'Games']]
+    covariance = SampleCovarianceEstimator().estimate_covariance(returns) * 12
+    mu = returns.mean() * 12
+    paths = correlated_gbm(mu, covariance, years=10, scenarios=2000, prices=False, chunk_size=300, seed=1)
+    assert (120, 2000, 4) == paths.shape
+    assert np.all(paths[0] == 0)
+    simulated = np.cov(paths[1:].reshape(-1, 4).T) * 12
+    assert np.allclose(covariance, simulated, rtol=0.05, atol=1e-4)
+    assert np.allclose(mu, paths[1:].mean(axis=(0, 1)) * 12, atol=0.01)
+    prices = correlated_gbm(mu, covariance, years=10, scenarios=2000, initial_prices=100, chunk_size=300, seed=1)
+    assert np.allclose(prices, 100 * np.cumprod(1 + paths, axis=0))
+
+
+def test_correlated_gbm_portfolio():
+    returns = load_industry_returns()['2000':][['Food', 'Beer', 'Smoke', 'Games']]
+    covariance = SampleCovarianceEstimator().estimate_covariance(returns) * 12
+    mu = returns.mean() * 12
+    weights = np.array([0.4, 0.3, 0.2, 0.1])
+    paths = correlated_gbm(mu, covariance, years=5, scenarios=500, prices=False, exact=True, chunk_size=100, seed=2)
+    rebalanced = correlated_gbm(mu, covariance, years=5, scenarios=500, prices=False, weights=weights,
+                                exact=True, chunk_size=100, seed=2)
+    assert (60, 500) == rebalanced.shape
+    assert np.allclose(paths @ weights, rebalanced)
+    held = correlated_gbm(mu, covariance, years=5, scenarios=500, prices=False, weights=weights,
+                          rebalance=False, exact=True, chunk_size=100, seed=2)
+    assert np.allclose(backtest_buy_and_hold(weights, paths), held)
+    values = correlated_gbm(mu, covariance, years=5, scenarios=500, weights=weights, initial_prices=1000,
+                            exact=True, chunk_size=100, seed=2)
+    assert np.allclose(1000 * (1 + rebalanced).cumprod(), values)
+
+
+def test_covariance_factor_cache():
+    covariance = np.array([[0.04, 0.01, 0.05], [0.01, 0.09, 0.1], [0.05, 0.1, 0.15]])
+    _cached_covariance_factor.cache_clear()
+    factor = _covariance_factor(covariance)
+    assert factor is _covariance_factor(covariance.copy())
+    assert 1 == _cached_covariance_factor.cache_info().hits
+    # the third asset is the sum of the first two: the covariance is singular
+    assert np.allclose(covariance, factor @ factor.T)
+    assert not factor.flags.writeable
@@ -58,6 +58,58 @@ def test_backtest_allocation_scheme():
     assert 73.7 == pytest.approx(equal_vs_cap, 0.1)
 
 
+def test_buy_and_hold_many_portfolios():
+    returns = read_returns()
+    weights = pd.DataFrame({"even": [0.5, 0.5], "aapl": [0.8, 0.2], "bnd": [0.1, 0.9]}, index=returns.columns)
+    portfolio_returns = backtest_buy_and_hold(weights, returns)
+    assert list(weights.columns) == list(portfolio_returns.columns)
+    assert portfolio_returns.index.equals(returns.index)
+    assert 10.99 == pytest.approx(final_wealth(portfolio_returns['even']), 0.001)
+    for name in weights.columns:
+        single = backtest_buy_and_hold(weights[name].values, returns)
+        assert np.allclose(single, portfolio_returns[name])
+    # the weights are aligned with the columns of the returns
+    reversed_weights = weights.iloc[::-1]
+    pd.testing.assert_frame_equal(portfolio_returns, backtest_buy_and_hold(reversed_weights, returns))
+    pd.testing.assert_series_equal(portfolio_returns['aapl'],
+                                   backtest_buy_and_hold(reversed_weights['aapl'], returns), check_names=False)
+
+
+@pytest.mark.parametrize("executor", ['threads', 'processes'])
+def test_backtest_allocation_in_parallel(executor):
+    industry_returns = load_industry_returns('ind30_m_vw_rets.csv')['2000':]
+    cap_weights = load_market_caps(size=30, weights=True)['2000':]
+    scheme = CapWeightedAllocationScheme(cap_weights=cap_weights)
+    serial = backtest_allocation(industry_returns, allocation_scheme=scheme)
+    parallel = backtest_allocation(industry_returns, allocation_scheme=scheme, executor=executor, n_workers=2)
+    assert serial.equals(parallel)
+
+    returns = industry_returns[['Food', 'Beer', 'Smoke', 'Games', 'Fin']]
+    scheme = GlobalMinimumVarianceAllocationScheme()
+    serial = backtest_allocation(returns, estimation_window=36, allocation_scheme=scheme)
+    parallel = backtest_allocation(returns, estimation_window=36, allocation_scheme=scheme,
+                                   executor=executor, n_workers=2)
+    assert np.allclose(serial, parallel, equal_nan=True, atol=1e-6)
+
+
+def test_backtest_many():
+    industry_returns = load_industry_returns('ind30_m_vw_rets.csv')['2000':]
+    cap_weights = load_market_caps(size=30, weights=True)['2000':]
+    schemes = {"EW": EquallyWeightedAllocationScheme(),
+               "CW": CapWeightedAllocationScheme(cap_weights=cap_weights)}
+    returns, metrics = backtest_many(industry_returns, schemes)
+    assert ["EW", "CW"] == list(returns.columns)
+    assert len(industry_returns) - 60 == len(returns)
+    for name, scheme in schemes.items():
+        single = backtest_allocation(industry_returns, allocation_scheme=scheme).dropna()
+        assert np.allclose(single, returns[name])
+    assert ["EW", "CW"] == list(metrics.index)
+    assert metrics.loc["EW", "max_drawdown"] == pytest.approx(collect_metrics(returns["EW"]).max_drawdown)
+
+    returns, _ = backtest_many(industry_returns, [EquallyWeightedAllocationScheme()])
+    assert ["EquallyWeightedAllocationScheme"] == list(returns.columns)
+
+
 def read_returns():
     aapl = read_prices_from_file('AAPL.monthly.20000101-20201231.csv')
     aapl = aapl.rename(columns={'Adj Close': 'AAPL'})
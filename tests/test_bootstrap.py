@@ -0,0 +1,54 @@
+import pytest
+
+from fintools import *
+
+
+def test_bootstrap_indices():
+    for method in ['iid', 'circular', 'stationary']:
+        indices = bootstrap_indices(100, 60, 500, method=method, block_size=6, seed=1)
+        assert (60, 500) == indices.shape
+        assert 0 <= indices.min() and indices.max() < 100
+        assert np.array_equal(indices, bootstrap_indices(100, 60, 500, method=method, block_size=6, seed=1))
+    with pytest.raises(ValueError):
+        bootstrap_indices(100, 60, 500, method='moving')
+
+
+def test_bootstrap_blocks():
+    n_periods = 100
+    # circular blocks: consecutive periods within each block of 6 steps, wrapping around the end
+    indices = bootstrap_indices(n_periods, 60, 500, method='circular', block_size=6, seed=2)
+    blocks = indices.reshape(10, 6, 500)
+    assert np.array_equal(blocks, (blocks[:, :1] + np.arange(6).reshape(1, -1, 1)) % n_periods)
+    # stationary blocks: geometric lengths with mean 6
+    indices = bootstrap_indices(n_periods, 60, 5000, method='stationary', block_size=6, seed=3)
+    continued = indices[1:] == (indices[:-1] + 1) % n_periods
+    # a new block may also start at the next period by chance
+    assert 1 - 1 / 6 + 1 / 6 / n_periods == pytest.approx(continued.mean(), abs=0.005)
+
+
+def test_bootstrap_returns():
+    returns = load_industry_returns()[['Food', 'Beer', 'Smoke']]
+    scenarios = bootstrap_returns(returns, n_steps=120, n_scenarios=200, seed=4)
+    assert 200 == len(scenarios)
+    assert 120 == scenarios.n_steps
+    panel = scenarios.panel()
+    assert (120, 200, 3) == panel.shape
+    # whole rows of the history are sampled
+    assert np.array_equal(returns.to_numpy()[scenarios.indices[:, 7]], panel[:, 7])
+    pd.testing.assert_frame_equal(pd.DataFrame(panel[:, 7], columns=returns.columns), scenarios.scenario(7))
+    assert np.array_equal(panel[:, :, 1], scenarios.asset('Beer').to_numpy())
+
+
+def test_bootstrap_backtests():
+    returns = load_industry_returns()[['Food', 'Beer', 'Smoke']]
+    scenarios = bootstrap_returns(returns, n_steps=60, n_scenarios=50, method='circular', seed=5)
+    weights = np.array([0.5, 0.3, 0.2])
+    portfolio_returns = backtest_buy_and_hold(weights, scenarios.panel())
+    assert (60, 50) == portfolio_returns.shape
+    stats = StrategySimulator(investment_strategy=NoRebalanceInvestmentStrategy()) \
+        .simulate(returns=scenarios.scenario(3), initial_portfolio_weights=weights, initial_balance=1)
+    assert np.allclose(portfolio_returns[:, 3], stats.return_history)
+    result = backtest_cppi(scenarios.asset('Food'), drawdown=0.2)
+    assert (60, 50) == result['wealth'].shape
+    single = bootstrap_returns(returns['Food'], n_steps=60, n_scenarios=50, method='circular', seed=5)
+    pd.testing.assert_frame_equal(scenarios.asset('Food'), single.asset())
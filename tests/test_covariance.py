@@ -1,5 +1,7 @@
+import copy
+
 import pytest
-from fintools.industry_data import *
+from fintools import *
 from sklearn.covariance import EmpiricalCovariance, LedoitWolf, OAS
 from sklearn.model_selection import train_test_split
 
@@ -32,3 +34,103 @@ def test_covariance():
     loglik_lw = LedoitWolf().fit(mixed_ret_train).score(mixed_ret_test)
     print(loglik_lw)
 
+
+returns = load_industry_returns('ind30_m_vw_rets.csv')['1995':'2005'][['Food', 'Beer', 'Smoke', 'Games',
+                                                                      'Books', 'Hlth', 'Fin']]
+
+
+def test_shrinkage_matches_sklearn():
+    window = returns.iloc[:60]
+    estimator = LedoitWolfCovarianceEstimator(target='identity')
+    expected = LedoitWolf().fit(window)
+    assert np.allclose(expected.covariance_, estimator.estimate_covariance(window))
+    assert expected.shrinkage_ == pytest.approx(estimator.shrinkage)
+    expected = OAS().fit(window)
+    estimator = OracleApproximatingShrinkageCovarianceEstimator()
+    assert np.allclose(expected.covariance_, estimator.estimate_covariance(window))
+
+
+def test_constant_correlation_shrinkage():
+    window = returns.iloc[:60]
+    estimator = LedoitWolfCovarianceEstimator()
+    covariance = estimator.estimate_covariance(window)
+    assert 0 < estimator.shrinkage < 1
+    sample = window.cov(ddof=0)
+    target = ConstantCorrelationCovarianceEstimator().estimate_covariance(window) * 59 / 60
+    assert np.allclose(estimator.shrinkage * target + (1 - estimator.shrinkage) * sample, covariance)
+
+
+@pytest.mark.parametrize("estimator", [SampleCovarianceEstimator(),
+                                       ConstantCorrelationCovarianceEstimator(),
+                                       LedoitWolfCovarianceEstimator(target='identity'),
+                                       LedoitWolfCovarianceEstimator(target='constant_correlation'),
+                                       OracleApproximatingShrinkageCovarianceEstimator(),
+                                       EwmaCovarianceEstimator(decay=0.94)])
+def test_update(estimator):
+    reference = copy.deepcopy(estimator)
+    estimator.estimate_covariance(returns.iloc[:36])
+    for k in range(1, 80):
+        covariance = estimator.update(returns.iloc[35 + k])
+        assert np.allclose(reference.estimate_covariance(returns.iloc[k:36 + k]), covariance, rtol=1e-10, atol=0)
+
+
+def test_window_moments():
+    moments = WindowMoments(returns.iloc[:24])
+    for k in range(1, 60):
+        moments.slide(returns.iloc[23 + k])
+        assert np.allclose(returns.iloc[k:24 + k].mean(), moments.mean())
+        assert np.allclose(returns.iloc[k:24 + k].cov(), moments.covariance())
+
+
+def test_ewma():
+    estimator = EwmaCovarianceEstimator(decay=0.94)
+    covariance = estimator.estimate_covariance(returns.iloc[:2])
+    first, second = returns.iloc[0].to_numpy(), returns.iloc[1].to_numpy()
+    expected = (0.94 * np.outer(first, first) + np.outer(second, second)) / 1.94
+    assert np.allclose(expected, covariance)
+    # the window slides: the first return leaves as the third one enters
+    covariance = estimator.update(returns.iloc[2])
+    assert np.allclose(EwmaCovarianceEstimator(decay=0.94).estimate_covariance(returns.iloc[1:3]), covariance)
+
+
+def test_statistical_factor():
+    estimator = StatisticalFactorCovarianceEstimator(n_factors=2)
+    window = returns.iloc[:60]
+    covariance = estimator.estimate_covariance(window)
+    assert np.allclose(np.diag(window.cov()), np.diag(covariance))
+    assert np.all(np.linalg.eigvalsh(covariance) > 0)
+    # the tracked components match the exact ones within the tolerance, also across the recomputations
+    for k in range(1, 70):
+        covariance = estimator.update(returns.iloc[59 + k])
+        expected = StatisticalFactorCovarianceEstimator(n_factors=2).estimate_covariance(returns.iloc[k:60 + k])
+        assert np.allclose(expected, covariance, rtol=0, atol=1e-8 * np.abs(expected).max().max())
+
+
+def test_factor_covariance():
+    rng = np.random.default_rng(42)
+    covariance = FactorCovariance(rng.normal(size=(50, 3)), [[0.04, 0.01, 0], [0.01, 0.02, 0], [0, 0, 0.01]],
+                                  rng.uniform(0.01, 0.05, 50))
+    dense = np.asarray(covariance)
+    assert (50, 50) == covariance.shape
+    x = rng.normal(size=50)
+    assert np.allclose(dense @ x, covariance @ x)
+    assert np.allclose(dense @ np.eye(50)[:, :4], covariance @ np.eye(50)[:, :4])
+    assert x @ dense @ x == pytest.approx(covariance.portfolio_variance(x))
+    assert np.allclose(np.linalg.solve(dense, x), covariance.solve(x))
+    assert np.allclose(np.diag(dense), covariance.diagonal())
+    assets = np.arange(50) % 3 == 0
+    assert np.allclose(dense[np.ix_(assets, assets)], np.asarray(covariance.subset(assets)))
+
+
+def test_factor_model_estimator():
+    fff = load_fff_returns_monthly()[['Mkt-RF', 'SMB', 'HML']]
+    covariance = FactorModelCovarianceEstimator(fff).estimate_covariance(returns)
+    assert (3, 3) == covariance.factor_covariance.shape
+    # the loadings are the OLS slopes
+    model = french_fama_regression(returns[['Food']], '1995', '2005', fff_return=load_fff_returns_monthly(),
+                                   regression_type=RegressionType.THREE_FACTOR)
+    slopes = model.params[['Mkt-RF', 'SMB', 'HML']]
+    assert np.allclose(slopes, covariance.loadings[0], atol=1e-2)
+    assert list(returns.columns) == list(covariance.as_data_frame().columns)
+    covariance = FactorModelCovarianceEstimator(n_factors=2).estimate_covariance(returns)
+    assert np.allclose(np.diag(returns.cov()), covariance.diagonal())
@@ -8,4 +8,66 @@ def test_cppi_no_drawdown():
     result = backtest_cppi(sp500_returns)
     print(result.keys())
     floor = result['floor']
-    
+    assert sp500_returns.shape == floor.shape
+    assert 800 == pytest.approx(floor.iloc[-1, 0])
+    assert 1000 == pytest.approx(result['peak'].iloc[-1, 0])
+    assert 46523.1106 == pytest.approx(result['wealth'].iloc[-1, 0], 0.0001)
+    assert 0.982054 == pytest.approx(result['risk_budget'].iloc[-1, 0], 0.0001)
+    # a Series of returns gives the same backtest, in a single column
+    series_result = backtest_cppi(sp500_returns['Close'].rename(None))
+    assert ['R'] == list(series_result['wealth'].columns)
+    assert np.allclose(result['wealth'], series_result['wealth'])
+    assert np.allclose(result['risky_wealth'], series_result['risky_wealth'])
+
+
+def test_cppi_drawdown():
+    sp500_prices = read_prices_from_file(filename='SP500_monthly.csv')
+    sp500_returns = compute_returns(sp500_prices[['Close']])
+    result = backtest_cppi(sp500_returns, drawdown=0.2)
+    assert 17789.5030 == pytest.approx(result['wealth'].iloc[-1, 0], 0.0001)
+    assert 17395.2545 == pytest.approx(result['peak'].iloc[-1, 0], 0.0001)
+    assert 13916.2036 == pytest.approx(result['floor'].iloc[-1, 0], 0.0001)
+    assert 0.590361 == pytest.approx(result['risky_allocation'].iloc[-1, 0], 0.0001)
+    assert (result['wealth'] >= result['floor']).all().all()
+
+
+def test_cppi_many_scenarios():
+    returns = geometric_brownian_motion(mu=0.07, sigma=0.15, years=5, scenarios=20, prices=False)
+    result = backtest_cppi(returns, drawdown=0.25)
+    assert (60, 20) == result['wealth'].shape
+    # every scenario is independent of the others
+    single = backtest_cppi(returns[[7]], drawdown=0.25)
+    assert np.allclose(single['wealth'][7], result['wealth'][7])
+    assert np.allclose(single['floor'][7], result['floor'][7])
+
+
+def test_cppi_monte_carlo_batched():
+    serial = cppi_monte_carlo_batched(scenarios=2500, sigma=0.4, multiplier=8, cushion_ratio=0.8, chunk_size=1000,
+                                      seed=3, n_workers=1)
+    assert 2500 == len(serial)
+    assert 0 < serial.floor_breach_probability < 1
+    assert serial.expected_shortfall > 0
+    # reproducible regardless of the number of workers
+    parallel = cppi_monte_carlo_batched(scenarios=2500, sigma=0.4, multiplier=8, cushion_ratio=0.8, chunk_size=1000,
+                                        seed=3, n_workers=2)
+    assert np.array_equal(serial.terminal_wealth, parallel.terminal_wealth)
+    assert np.array_equal(serial.breached, parallel.breached)
+    # full paths agree with the summary
+    full = cppi_monte_carlo_batched(scenarios=2500, sigma=0.4, multiplier=8, cushion_ratio=0.8, chunk_size=1000,
+                                    seed=3, n_workers=1, full_paths=True)
+    assert (120, 2500) == full.paths['wealth'].shape
+    assert np.allclose(full.paths['wealth'].iloc[-1], serial.terminal_wealth)
+
+
+def test_cppi_monte_carlo_defaults():
+    import inspect
+    defaults = inspect.signature(cppi_monte_carlo).parameters
+    batched_defaults = inspect.signature(cppi_monte_carlo_batched).parameters
+    for name in ['mu', 'sigma', 'multiplier', 'cushion_ratio', 'risk_free_rate', 'start_value', 'years']:
+        assert defaults[name].default == batched_defaults[name].default
+    # with the same scenarios, both studies give the same terminal wealth
+    batched = cppi_monte_carlo_batched(scenarios=200, seed=5, n_workers=1, full_paths=True)
+    risky = batched.paths['risky_wealth'].pct_change()
+    risky.iloc[0] = batched.paths['risky_wealth'].iloc[0] / 1000 - 1
+    expected = backtest_cppi(risky, risk_free_rate=0.03, multiplier=3, cushion_ratio=0.0)
+    assert np.allclose(expected['wealth'].iloc[-1], batched.terminal_wealth)
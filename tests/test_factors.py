@@ -1,7 +1,11 @@
+import numpy as np
+import pandas as pd
 import pytest
 
 from fintools.calculator import resample_returns
-from fintools.factors import french_fama_regression, RegressionType
+from fintools.factors import french_fama_regression, french_fama_regressions, rolling_french_fama_regression, \
+    RegressionType
+from fintools.industry_data import load_industry_returns
 from fintools.price_data import read_prices_from_file
 
 
@@ -25,3 +29,51 @@ def test_factors():
     assert 0.504416 == pytest.approx(params['HML'], 0.0001)
     assert -0.469505 == pytest.approx(params['SMB'], 0.0001)
 
+
+@pytest.mark.parametrize("regression_type", list(RegressionType))
+def test_french_fama_regressions(regression_type):
+    returns = load_industry_returns('ind30_m_vw_rets.csv')['1990':'2010'][['Food', 'Beer', 'Smoke', 'Fin']]
+    regressions = french_fama_regressions(returns, '1995-01', '2010-12', regression_type=regression_type)
+    assert 4 == len(regressions)
+    for column in returns.columns:
+        model = french_fama_regression(returns[[column]], '1995-01', '2010-12', regression_type=regression_type)
+        assert np.allclose(model.params, regressions.params.loc[column, model.params.index])
+        assert np.allclose(model.tvalues, regressions.t_stats.loc[column, model.params.index])
+        assert model.rsquared == pytest.approx(regressions.r_squared[column])
+        assert model.params['Alpha'] == pytest.approx(regressions.alphas[column])
+    assert 'Alpha' not in regressions.betas.columns
+
+
+def test_french_fama_regressions_missing_returns():
+    returns = load_industry_returns('ind30_m_vw_rets.csv')['1995':'2010'][['Food', 'Beer', 'Smoke']].copy()
+    returns.loc['1995-01':'1996-12', 'Beer'] = np.nan
+    regressions = french_fama_regressions(returns, '1995-01', '2010-12')
+    assert [192, 168, 192] == regressions.n_observations.tolist()
+    model = french_fama_regression(returns[['Beer']].loc['1997':], '1997-01', '2010-12')
+    assert np.allclose(model.params, regressions.params.loc['Beer', model.params.index])
+    assert (3, 5) == regressions.as_data_frame().shape
+
+
+@pytest.mark.parametrize("regression_type", list(RegressionType))
+def test_rolling_french_fama_regression(regression_type):
+    returns = load_industry_returns('ind30_m_vw_rets.csv')['1980':'2010'][['Food', 'Beer', 'Fin']].copy()
+    returns.loc['1990-01':'1990-03', 'Food'] = np.nan
+    betas = rolling_french_fama_regression(returns, window=36, regression_type=regression_type)
+    assert betas['Mkt-RF'].iloc[:35].isna().all().all()
+    # the windows that contain missing returns
+    assert 38 == betas['Mkt-RF']['Food'].iloc[35:].isna().sum()
+    for end in ['1984-06', '1995-12', '2010-12']:
+        start = str(pd.Period(end, 'M') - 35)
+        model = french_fama_regression(returns[['Beer']], start, end, regression_type=regression_type)
+        assert list(model.params.index) == list(betas.keys())
+        for name in model.params.index:
+            assert model.params[name] == pytest.approx(betas[name].loc[end, 'Beer'])
+
+
+def test_expanding_french_fama_regression():
+    returns = load_industry_returns('ind30_m_vw_rets.csv')['1970':'2000']['Beer']
+    betas = rolling_french_fama_regression(returns, window=24, expanding=True,
+                                           regression_type=RegressionType.THREE_FACTOR)
+    model = french_fama_regression(returns.to_frame()['1970-01':'1990-12'], '1970-01', '1990-12',
+                                   regression_type=RegressionType.THREE_FACTOR)
+    assert model.params['HML'] == pytest.approx(betas['HML'].loc['1990-12', 'Beer'])
@@ -48,3 +48,17 @@ def test_inst_to_annual():
 
 def test_annual_to_inst():
     assert annual_to_inst(0.5) == pytest.approx(0.4054, 0.001)
+
+
+def test_simulate_cir_seed():
+    rates = simulate_cir(a=0.05, b=0.03, sigma=0.05, n_years=5, n_scenarios=50, seed=5)
+    assert (61, 50) == rates.shape
+    assert rates.equals(simulate_cir(a=0.05, b=0.03, sigma=0.05, n_years=5, n_scenarios=50, seed=5))
+    assert 0.03 == pytest.approx(rates.iloc[0, 0])
+
+
+def test_simulate_cir_exact():
+    rates = simulate_cir(a=0.05, b=0.03, sigma=0.05, n_years=5, n_scenarios=50, seed=5, exact=True)
+    assert (61, 50) == rates.shape
+    assert 0.03 == pytest.approx(rates.iloc[0, 0])
+    assert (rates >= 0).all().all()
@@ -37,3 +37,101 @@ def test_compute_drawdown():
     assert -0.8330 == pytest.approx(small_cap_drawdown.max_drawdown, 0.001)
     assert pd.Period('1932-05', 'M') == large_cap_drawdown.max_drawdown_index
     assert pd.Period('1932-05', 'M') == small_cap_drawdown.max_drawdown_index
+
+
+def _metrics_by_column(returns, risk_free_rate):
+    return {
+        "compound_return": compute_compound_return(returns),
+        "annualized_return": returns.aggregate(annualize_returns, periods_in_year=12),
+        "annualized_volatility": returns.aggregate(annualize_volatility, periods_in_year=12),
+        "skewness": returns.skew(),
+        "excess_kurtosis": returns.kurt(),
+        "cornish_fisher_var": parametric_VaR(returns, confidence_level=5),
+        "historic_var": historic_VaR(returns, confidence_level=5),
+        "conditional_var": conditional_VaR(returns, confidence_level=5),
+        "sharpe_ratio": returns.aggregate(annualized_sharpe_ratio, risk_free_rate=risk_free_rate, periods_in_year=12),
+        "max_drawdown": returns.agg(lambda r: compute_drawdown(r).max_drawdown)
+    }
+
+
+def test_collect_metrics():
+    returns = hfi.copy()
+    returns['Constant'] = 0.01
+    metrics = collect_metrics(returns, risk_free_rate=0.02)
+    expected = pd.DataFrame(_metrics_by_column(returns, 0.02))
+    pd.testing.assert_frame_equal(expected, metrics, rtol=1e-10)
+    metrics = collect_metrics(hfi['CTA Global'], risk_free_rate=0.02)
+    expected = pd.Series(_metrics_by_column(hfi['CTA Global'], 0.02))
+    pd.testing.assert_series_equal(expected, metrics, rtol=1e-10)
+
+
+def test_collect_metrics_loss_beyond_total():
+    returns = hfi.iloc[:24].copy()
+    returns.iloc[5, 0] = -1.5
+    metrics = collect_metrics(returns)
+    assert (1 + returns.iloc[:, 0]).prod() - 1 == pytest.approx(metrics.iloc[0]['compound_return'])
+    assert compute_compound_return(returns.iloc[:, 0]) == pytest.approx(metrics.iloc[0]['compound_return'])
+    # the unfused path, with a missing return in another column
+    returns.iloc[0, 1] = np.nan
+    assert collect_metrics(returns).iloc[0]['compound_return'] == pytest.approx(metrics.iloc[0]['compound_return'])
+
+
+def test_collect_metrics_missing_returns():
+    returns = hfi.copy()
+    returns.iloc[:10, 0] = np.nan
+    metrics = collect_metrics(returns)
+    assert collect_metrics(hfi.iloc[10:]).loc['Convertible Arbitrage', 'skewness'] == \
+           pytest.approx(metrics.loc['Convertible Arbitrage', 'skewness'])
+
+
+def test_risk_accumulator():
+    accumulator = RiskAccumulator(columns=hfi.columns)
+    accumulator.update(hfi.iloc[:5])
+    for period in range(5, 100):
+        accumulator.update(hfi.iloc[period])
+    accumulator.update(hfi.iloc[100:])
+    assert len(accumulator) == len(hfi)
+    pd.testing.assert_series_equal(hfi.skew(), accumulator.skewness, check_names=False)
+    pd.testing.assert_series_equal(hfi.kurt(), accumulator.excess_kurtosis, check_names=False)
+    pd.testing.assert_series_equal(hfi.std(), accumulator.volatility, check_names=False)
+    pd.testing.assert_series_equal(semi_deviation(hfi), accumulator.semi_deviation, check_names=False)
+    pd.testing.assert_series_equal(parametric_VaR(hfi), accumulator.parametric_var, check_names=False)
+    expected_drawdowns = hfi.aggregate(lambda returns: compute_drawdown(returns).max_drawdown)
+    pd.testing.assert_series_equal(expected_drawdowns, accumulator.max_drawdown)
+    metrics = accumulator.as_data_frame()
+    assert metrics['historic_var'].values == pytest.approx(historic_VaR(hfi).values, rel=0.05)
+    assert metrics['conditional_var'].values == pytest.approx(conditional_VaR(hfi).values, rel=0.1)
+
+
+def test_risk_accumulator_single_stream():
+    returns = hfi['CTA Global']
+    accumulator = RiskAccumulator()
+    for value in returns.iloc[:20]:
+        accumulator.update(value)
+    # exact while the sketch holds every return
+    assert accumulator.historic_var == pytest.approx(historic_VaR(returns.iloc[:20]))
+    assert accumulator.conditional_var == pytest.approx(conditional_VaR(returns.iloc[:20]))
+    assert accumulator.drawdown == pytest.approx(compute_drawdown(returns.iloc[:20]).drawdowns.iloc[-1])
+    fat_tailed = np.random.default_rng(1).standard_t(4, 100000) * 0.01
+    accumulator = RiskAccumulator().update(fat_tailed)
+    assert accumulator.historic_var == pytest.approx(historic_VaR(fat_tailed), rel=0.01)
+    assert accumulator.conditional_var == pytest.approx(conditional_VaR(pd.Series(fat_tailed)), rel=0.02)
+
+
+def test_rolling_risk_metrics():
+    returns = hfi.iloc[:, :3].copy()
+    returns.iloc[50, 0] = np.nan
+    window = 36
+    pd.testing.assert_frame_equal(returns.rolling(window).apply(historic_VaR),
+                                  rolling_historic_VaR(returns, window))
+    pd.testing.assert_frame_equal(returns.rolling(window).apply(conditional_VaR),
+                                  rolling_conditional_VaR(returns, window))
+    pd.testing.assert_frame_equal(returns.rolling(window).apply(semi_deviation),
+                                  rolling_semi_deviation(returns, window))
+    pd.testing.assert_frame_equal(returns.rolling(window).apply(lambda r: compute_drawdown(r).max_drawdown),
+                                  rolling_max_drawdown(returns, window))
+    series = hfi['CTA Global']
+    pd.testing.assert_series_equal(series.rolling(12).apply(historic_VaR, kwargs={'confidence_level': 10}),
+                                   rolling_historic_VaR(series, 12, confidence_level=10))
+    pd.testing.assert_series_equal(series.rolling(48).apply(lambda r: compute_drawdown(r).max_drawdown),
+                                   rolling_max_drawdown(series, 48))
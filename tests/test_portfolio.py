@@ -43,7 +43,7 @@ def test_maximize_sharpe_ratio():
     w = maximize_sharpe_ratio(expected_returns, covariance,
                               risk_free_rate=risk_free_rate)
     assert 1.0 == pytest.approx(w.sum(), 0.000001)
-    expected = [0.11430192, 0.06604457, 0.22653882, 0.59311468]
+    expected = [0.11447609, 0.06601850, 0.22657394, 0.59293148]
     assert np.all([expected[i] == pytest.approx(w[i], 0.00001) for i in range(0, len(expected))])
 
 
@@ -55,10 +55,190 @@ def test_global_minimum_variance_portfolio():
     # risk_free_rate = 0.01
     w = global_minimum_variance_portfolio(covariance)
     assert 1 == w.sum()
-    expected = [0.37456, 0.07577, 0.0, 0.54966]
+    expected = [0.37463, 0.07576, 0.0, 0.54961]
     assert np.all([expected[i] == pytest.approx(w[i], 0.0001) for i in range(0, len(expected))])
 
 
+def test_analytic_gradients():
+    from scipy.optimize import check_grad
+    assets = ['Games', 'Smoke', 'Beer', 'Food']
+    returns = industry_returns["1996":"2000"][assets]
+    expected_returns = annualize_returns(returns, 12)
+    covariance = returns.cov()
+    w = np.array([0.1, 0.2, 0.3, 0.4])
+    error = check_grad(compute_portfolio_variance, portfolio_volatility_gradient, w, covariance)
+    assert error == pytest.approx(0, abs=1e-6)
+    error = check_grad(sharpe_ratio, sharpe_ratio_gradient, w, expected_returns, covariance, 0.01)
+    assert error == pytest.approx(0, abs=1e-5)
+
+
+def test_unconstrained_portfolios():
+    assets = ['Games', 'Smoke', 'Beer', 'Food']
+    returns = industry_returns["1996":"2000"][assets]
+    expected_returns = annualize_returns(returns, 12)
+    covariance = returns.cov()
+    w = global_minimum_variance_portfolio(covariance, allow_short=True)
+    assert 1 == pytest.approx(w.sum())
+    # the gradient of the variance is the same for every asset
+    assert np.allclose((covariance @ w)[0], covariance @ w)
+    long_only = global_minimum_variance_portfolio(covariance)
+    assert compute_portfolio_variance(w, covariance) < compute_portfolio_variance(long_only, covariance)
+    w = maximize_sharpe_ratio(expected_returns, covariance, risk_free_rate=0.01, allow_short=True)
+    assert 1 == pytest.approx(w.sum())
+    # the marginal risk is proportional to the excess return
+    ratio = (covariance @ w) / (expected_returns - 0.01)
+    assert np.allclose(ratio.iloc[0], ratio)
+    # with a target return above the highest asset return, only a short position can reach it
+    target = expected_returns.max() + 0.05
+    w = maximize_sharpe_ratio(expected_returns, covariance, targeted_annual_return=target, allow_short=True)
+    assert 1 == pytest.approx(w.sum())
+    assert target == pytest.approx(w @ expected_returns)
+    assert w.min() < 0
+    # the variance gradient is in the span of the two constraints
+    span = np.column_stack([np.ones(4), expected_returns])
+    coefficients = np.linalg.lstsq(span, covariance @ w, rcond=None)[0]
+    assert np.allclose(span @ coefficients, covariance @ w)
+
+
+def test_long_only_warm_start():
+    returns = industry_returns["1996":"2000"][['Games', 'Smoke', 'Beer', 'Food']]
+    covariance = returns.cov()
+    expected = global_minimum_variance_portfolio(covariance)
+    for initial_weights in ([1, 0, 0, 0], [0, 0, 1, 0], [0.25, 0.25, 0.25, 0.25]):
+        w = global_minimum_variance_portfolio(covariance, initial_weights=initial_weights)
+        assert np.allclose(expected, w)
+
+
+def test_factor_covariance_optimizers():
+    returns = industry_returns["1995":"2015"]
+    covariance = FactorModelCovarianceEstimator(n_factors=4).estimate_covariance(returns)
+    dense = covariance.as_data_frame()
+    expected_returns = annualize_returns(returns, 12)
+    w = np.repeat(1 / 30, 30)
+    assert compute_portfolio_variance(w, dense) == pytest.approx(compute_portfolio_variance(w, covariance))
+    assert np.allclose(portfolio_volatility_gradient(w, dense), portfolio_volatility_gradient(w, covariance))
+    for allow_short in (True, False):
+        assert np.allclose(global_minimum_variance_portfolio(dense, allow_short=allow_short),
+                           global_minimum_variance_portfolio(covariance, allow_short=allow_short))
+        assert np.allclose(maximize_sharpe_ratio(expected_returns, dense, 0.01, allow_short=allow_short),
+                           maximize_sharpe_ratio(expected_returns, covariance, 0.01, allow_short=allow_short))
+
+
+def test_factor_covariance_efficient_frontier(monkeypatch):
+    returns = industry_returns["1995":"2015"]
+    covariance = FactorModelCovarianceEstimator(n_factors=4).estimate_covariance(returns)
+    dense = covariance.as_data_frame()
+    expected_returns = annualize_returns(returns, 12)
+    expected_points = critical_line(expected_returns, dense)
+    expected_frontier = efficient_frontier(expected_returns, dense, n_points=15)
+
+    def densify(*args, **kwargs):
+        raise AssertionError("the dense covariance matrix was built")
+
+    monkeypatch.setattr(FactorCovariance, '__array__', densify)
+    turning_points = critical_line(expected_returns, covariance)
+    assert np.allclose(expected_points[0], turning_points[0])
+    assert np.allclose(expected_points[-1], turning_points[-1])
+    frontier = efficient_frontier(expected_returns, covariance, n_points=15)
+    assert np.allclose(expected_frontier.weights, frontier.weights)
+    assert np.allclose(expected_frontier.volatilities, frontier.volatilities)
+
+
+def test_rolling_covariances():
+    returns = industry_returns["1996":"2000"][['Games', 'Smoke', 'Beer', 'Food']]
+    covariances = rolling_covariances(returns, 24)
+    assert (len(returns) - 23, 4, 4) == covariances.shape
+    assert np.allclose(returns.iloc[:24].cov(), covariances[0])
+    assert np.allclose(returns.iloc[-24:].cov(), covariances[-1])
+
+
+def test_batch_global_minimum_variance():
+    returns = industry_returns["1996":"2000"][['Games', 'Smoke', 'Beer', 'Food']]
+    covariances = rolling_covariances(returns, 24)[::12]
+    w = batch_global_minimum_variance(covariances, allow_short=True)
+    for k, covariance in enumerate(covariances):
+        expected = np.linalg.solve(covariance, np.ones(4))
+        assert np.allclose(expected / expected.sum(), w[k])
+    w = batch_global_minimum_variance(covariances)
+    assert np.allclose(1, w.sum(axis=1))
+    for k, covariance in enumerate(covariances):
+        expected = global_minimum_variance_portfolio(covariance)
+        assert compute_portfolio_variance(w[k], covariance) == \
+               pytest.approx(compute_portfolio_variance(expected, covariance), 1e-6)
+
+
+def test_batch_maximize_sharpe_ratio():
+    returns = industry_returns["1996":"2000"][['Games', 'Smoke', 'Beer', 'Food']]
+    covariances = np.stack([returns.cov()] * 3)
+    expected_returns = annualize_returns(returns, 12)
+    w = batch_maximize_sharpe_ratio(expected_returns, covariances, risk_free_rate=0.01)
+    expected = [0.11447609, 0.06601850, 0.22657394, 0.59293148]
+    assert np.allclose(expected, w, atol=1e-4)
+    w = batch_maximize_sharpe_ratio(expected_returns, covariances, risk_free_rate=0.01, allow_short=True)
+    expected = np.linalg.solve(returns.cov(), expected_returns - 0.01)
+    assert np.allclose(expected / expected.sum(), w)
+
+
+def test_batch_cholesky_solve():
+    returns = industry_returns["1996":"2000"][['Games', 'Smoke', 'Beer', 'Food']]
+    covariances = rolling_covariances(returns, 24)[::12]
+    rhs = np.arange(4 * len(covariances), dtype=float).reshape(len(covariances), 4)
+    expected = np.linalg.solve(covariances, rhs[..., np.newaxis])[..., 0]
+    assert np.allclose(expected, batch_cholesky_solve(covariances, rhs))
+    assert np.allclose(expected[0], batch_cholesky_solve(covariances[0], rhs[0]))
+
+
+def test_rank_deficient_covariance():
+    returns = industry_returns["1996":"2000"][['Games', 'Smoke', 'Beer', 'Food']]
+    duplicated = returns.assign(Beer2=returns['Beer'])
+    covariance = duplicated.cov()
+    expected_returns = annualize_returns(duplicated, 12)
+    # the weight of Beer is split evenly between the two identical assets
+    for allow_short in [False, True]:
+        w = global_minimum_variance_portfolio(covariance, allow_short=allow_short)
+        expected = global_minimum_variance_portfolio(returns.cov(), allow_short=allow_short)
+        assert np.allclose(expected, [w[0], w[1], w[2] + w[4], w[3]])
+        assert w[2] == pytest.approx(w[4])
+        w = maximize_sharpe_ratio(expected_returns, covariance, risk_free_rate=0.01, allow_short=allow_short)
+        expected = maximize_sharpe_ratio(expected_returns[:4], returns.cov(), risk_free_rate=0.01,
+                                         allow_short=allow_short)
+        assert np.allclose(expected, [w[0], w[1], w[2] + w[4], w[3]])
+        w = batch_global_minimum_variance(np.stack([covariance] * 2), allow_short=allow_short)
+        assert np.allclose(global_minimum_variance_portfolio(covariance, allow_short=allow_short), w)
+    # every window of the backtest is rank deficient
+    portfolio_returns = backtest_allocation(duplicated, estimation_window=36,
+                                            allocation_scheme=GlobalMinimumVarianceAllocationScheme())
+    assert portfolio_returns.iloc[36:].notna().all()
+
+
+def test_efficient_frontier():
+    assets = ['Games', 'Smoke', 'Beer', 'Food', 'Fin']
+    returns = industry_returns["1996":"2000"][assets]
+    expected_returns = annualize_returns(returns, 12)
+    covariance = returns.cov()
+    frontier = efficient_frontier(expected_returns, covariance, n_points=25)
+    assert 25 == len(frontier)
+    assert (25, 5) == frontier.weights.shape
+    assert np.allclose(1, frontier.weights.sum(axis=1))
+    assert np.all(frontier.weights >= -1e-12)
+    assert np.allclose(np.linspace(expected_returns.min(), expected_returns.max(), 25), frontier.returns)
+    for k in [0, 6, 12, 18, 24]:
+        w = minimize_volatility(frontier.returns[k], expected_returns, covariance)
+        assert compute_portfolio_variance(w, covariance) == pytest.approx(frontier.volatilities[k], abs=1e-6)
+    assert (25, 2) == frontier.as_data_frame().shape
+
+
+def test_critical_line():
+    assets = ['Games', 'Smoke', 'Beer', 'Food']
+    returns = industry_returns["1996":"2000"][assets]
+    expected_returns = annualize_returns(returns, 12)
+    turning_points = critical_line(expected_returns, returns.cov())
+    # from the highest return asset to the global minimum variance portfolio
+    assert np.allclose([0, 0, 1, 0], turning_points[0])
+    expected = [0.37463, 0.07576, 0.0, 0.54961]
+    assert np.allclose(expected, turning_points[-1], atol=1e-5)
+
+
 def test_portfolio_class():
     symbols = ['US', 'IN', 'BD']
     weights = [.5, .3, .2]
@@ -0,0 +1,34 @@
+import pytest
+
+from fintools import *
+
+
+def test_standard_normal_seed():
+    z1 = standard_normal(12, 100, seed=42)
+    z2 = standard_normal(12, 100, seed=42)
+    assert (12, 100) == z1.shape
+    assert np.array_equal(z1, z2)
+    assert not np.array_equal(z1, standard_normal(12, 100, seed=43))
+
+
+def test_standard_normal_antithetic():
+    z = standard_normal(5, 11, seed=1, antithetic=True)
+    assert (5, 11) == z.shape
+    assert np.array_equal(z[:, :5], -z[:, 6:11])
+
+
+def test_standard_normal_sobol():
+    z = standard_normal(3, 1024, seed=1, sobol=True)
+    assert (3, 1024) == z.shape
+    assert np.all(np.isfinite(z))
+    assert 0 == pytest.approx(z.mean(axis=1), abs=0.01)
+    assert 1 == pytest.approx(z.std(axis=1), abs=0.05)
+
+
+def test_spawn_generators():
+    first = [g.standard_normal() for g in spawn_generators(7, 3)]
+    second = [g.standard_normal() for g in spawn_generators(7, 3)]
+    assert first == second
+    assert 3 == len(set(first))
+    children = spawn_generators(make_generator(7), 2)
+    assert 2 == len(children)
@@ -0,0 +1,41 @@
+import pytest
+
+from fintools import *
+
+
+def discount_along_paths(rates, steps_per_year):
+    return np.exp(-np.trapezoid(rates, dx=1 / steps_per_year, axis=0))
+
+
+@pytest.mark.parametrize("model", [VasicekModel(a=0.5, b=0.04, sigma=0.02, initial_rate=0.02),
+                                   CirModel(a=0.5, b=0.04, sigma=0.1, initial_rate=0.02),
+                                   HullWhiteModel(a=0.3, sigma=0.01, forward_rate=lambda t: 0.02 + 0.002 * t)])
+def test_zero_coupon_prices(model):
+    result = simulate_short_rates(model, n_years=5, n_scenarios=20000, steps_per_year=50, seed=1)
+    rates = result['rates'].values
+    prices = result['zero_coupon_prices']
+    assert (251, 20000) == prices.shape
+    # the closed form price agrees with the Monte Carlo discount factor
+    assert discount_along_paths(rates, 50).mean() == pytest.approx(prices.iloc[0, 0], 0.001)
+    assert np.allclose(1, prices.iloc[-1])
+
+
+def test_hull_white_fits_initial_curve():
+    model = HullWhiteModel(a=0.3, sigma=0.01, forward_rate=0.03)
+    result = simulate_short_rates(model, n_years=5, n_scenarios=10, seed=1)
+    assert np.exp(-0.03 * 5) == pytest.approx(result['zero_coupon_prices'].iloc[0, 0])
+    assert 0.03 == pytest.approx(result['rates'].iloc[0, 0])
+
+
+def test_cir_positive():
+    result = simulate_short_rates(CirModel(a=0.2, b=0.02, sigma=0.2), n_years=10, n_scenarios=1000, seed=2)
+    assert (result['rates'] >= 0).all().all()
+
+
+def test_iter_short_rates():
+    model = VasicekModel(a=0.5, b=0.04, sigma=0.02)
+    chunks = list(iter_short_rates(model, n_years=2, n_scenarios=2500, chunk_size=1000, maturity=3, seed=3))
+    assert [1000, 1000, 500] == [chunk['rates'].shape[1] for chunk in chunks]
+    assert (25, 500) == chunks[-1]['zero_coupon_prices'].shape
+    again = list(iter_short_rates(model, n_years=2, n_scenarios=2500, chunk_size=1000, maturity=3, seed=3))
+    assert np.array_equal(chunks[1]['rates'], again[1]['rates'])
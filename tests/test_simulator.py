@@ -46,3 +46,56 @@ def read_returns():
     prices = aapl.join(bnd).dropna()
     prices = prices['2009-12-31':'2020-12-31']
     return compute_returns(prices)
+
+
+class _ConstantMixStrategy(InvestmentStrategy):
+    """
+    Rebalance to the target weights every period, one scenario at a time
+    """
+
+    def __init__(self, target_weights):
+        self.target_weights = np.asarray(target_weights)
+
+    def update_portfolio_weighs(self, current_weights, account_value, returns):
+        return self.target_weights
+
+
+def test_simulate_scenarios():
+    returns = load_industry_returns()[['Food', 'Beer', 'Smoke']]
+    panel = bootstrap_returns(returns, n_steps=60, n_scenarios=200, seed=1).panel()
+    weights = np.array([0.5, 0.3, 0.2])
+    stats = StrategySimulator(investment_strategy=NoRebalanceInvestmentStrategy()) \
+        .simulate(returns=panel, initial_portfolio_weights=weights, initial_balance=100)
+    assert 200 == len(stats)
+    assert (60, 200) == stats.return_history.shape
+    assert np.allclose(backtest_buy_and_hold(weights, panel), stats.return_history)
+    assert np.allclose(100 * (1 + stats.return_history).prod(), stats.terminal_values)
+    single = StrategySimulator(investment_strategy=NoRebalanceInvestmentStrategy()) \
+        .simulate(returns=pd.DataFrame(panel[:, 9]), initial_portfolio_weights=weights, initial_balance=100)
+    assert np.allclose(single.account_history, stats.account_history[9])
+    # a strategy that only updates one scenario at a time
+    stats = StrategySimulator(investment_strategy=_ConstantMixStrategy(weights)) \
+        .simulate(returns=panel, initial_portfolio_weights=weights, initial_balance=1)
+    assert np.allclose(panel @ weights, stats.return_history)
+    rebalanced = StrategySimulator().simulate(returns=panel, initial_portfolio_weights=weights, initial_balance=1)
+    assert np.allclose(stats.account_history, rebalanced.account_history)
+
+
+class _LabelledStrategy(InvestmentStrategy):
+    """
+    Move everything to AAPL after a month where it beat BND, otherwise to BND
+    """
+
+    def update_portfolio_weighs(self, current_weights, account_value, returns):
+        assert np.ndim(account_value) == 0
+        return [1.0, 0.0] if returns['AAPL'] > returns['BND'] else [0.0, 1.0]
+
+
+def test_strategy_receives_labelled_returns():
+    returns = read_returns()
+    stats = StrategySimulator(investment_strategy=_LabelledStrategy()) \
+        .simulate(returns=returns, initial_portfolio_weights=[0.5, 0.5], initial_balance=1)
+    winner = (returns['AAPL'] > returns['BND']).shift(1)
+    expected = np.where(winner, returns['AAPL'], returns['BND'])
+    expected[0] = returns.iloc[0].mean()
+    assert np.allclose(expected, stats.return_history)
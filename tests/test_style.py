@@ -13,6 +13,16 @@ def test_style():
     assert weights['Smoke'] == pytest.approx(48.59, 4)
 
 
+def test_tracking_error_gradient():
+    from scipy.optimize import check_grad
+    ind = load_industry_data('ind30_m_vw_rets.csv')['2000':]
+    bb_r = ind[['Beer', 'Smoke', 'Food']]
+    ref_r = ind['Games']
+    w = np.array([0.2, 0.3, 0.5])
+    error = check_grad(portfolio_tracking_error, portfolio_tracking_error_gradient, w, ref_r, bb_r)
+    assert error == pytest.approx(0, abs=1e-5)
+
+
 def test_style_ff():
     start_index = '1990-01'
     end_index = '2012-05'
@@ -33,3 +43,48 @@ def test_style_ff():
     assert weights['RMW'] == pytest.approx(18.09, 4)
     assert weights['Mkt-RF'] == pytest.approx(54.15, 4)
 
+
+def test_style_analysis_least_squares():
+    ind = load_industry_data('ind30_m_vw_rets.csv')['1990':] / 100
+    explanatory = ind[['Beer', 'Smoke', 'Food', 'Fin', 'Games']]
+    dependent = 0.3 * ind['Beer'] + 0.7 * ind['Fin']
+    weights = style_analysis(dependent, explanatory)
+    assert np.allclose([0.3, 0, 0, 0.7, 0], weights)
+
+
+@pytest.mark.parametrize("executor", ['serial', 'threads', 'processes'])
+def test_rolling_style_analysis(executor):
+    np.random.seed(999)
+    ind = load_industry_data('ind30_m_vw_rets.csv')['2000':]
+    explanatory = ind[['Beer', 'Smoke', 'Food', 'Fin']]
+    dependent = 0.3 * ind["Beer"] + .5 * ind["Smoke"] + 0.2 * np.random.normal(scale=0.15 / (12 ** .5),
+                                                                               size=ind.shape[0])
+    weights = rolling_style_analysis(dependent, explanatory, window=36, executor=executor, n_workers=2)
+    assert len(ind) - 35 == len(weights)
+    assert ind.index[35] == weights.index[0]
+    assert np.allclose(1, weights.sum(axis=1))
+    for k in [0, 17, len(weights) - 1]:
+        expected = style_analysis(dependent.iloc[k:k + 36], explanatory.iloc[k:k + 36])
+        assert np.allclose(expected, weights.iloc[k])
+
+
+def test_style_analysis_collinear():
+    ind = load_industry_data('ind30_m_vw_rets.csv')['1990':] / 100
+    explanatory = ind[['Beer', 'Food']].assign(Beer2=ind['Beer'])
+    dependent = 0.5 * ind['Beer'] + 0.5 * ind['Food']
+    weights = style_analysis(dependent, explanatory)
+    assert np.allclose([0.25, 0.5, 0.25], weights)
+    rolling = rolling_style_analysis(dependent, explanatory, window=36)
+    assert np.allclose(rolling['Beer'], rolling['Beer2'])
+    assert np.allclose(0.5, rolling['Beer'] + rolling['Beer2'])
+
+
+def test_style_analysis_missing_returns():
+    ind = load_industry_data('ind30_m_vw_rets.csv')['2000':] / 100
+    explanatory = ind[['Beer', 'Smoke', 'Food', 'Fin']]
+    dependent = 0.3 * ind['Beer'] + 0.7 * ind['Fin']
+    dependent.iloc[[5, 40]] = np.nan
+    weights = style_analysis(dependent, explanatory)
+    assert np.allclose([0.3, 0, 0, 0.7], weights)
+    rolling = rolling_style_analysis(dependent, explanatory, window=len(ind) - 2)
+    assert np.allclose(weights, rolling.iloc[0])